@@ -0,0 +1,41 @@
+# Description : Script to move staging cycles older than a given age from the hot DB into the archive DB
+
+import argparse
+import datetime
+import dateutil.relativedelta as rd
+from database import Database
+from db_metrics import DBMetrics
+
+
+class ArchiveData:
+
+    def __init__(self):
+        # connections, including those of a running dashboard, attach the archive once it exists
+        Database.create_archive()
+        self.db = Database()
+        self.db.create_table()
+
+    def archive_older_than(self, days, batch_size, vacuum):
+        before_date = (datetime.datetime.now() + rd.relativedelta(days = -days)).date()
+        print(f"=============================== Archiving cycles started before {before_date} [{datetime.datetime.now()}] ===========================")
+        res, moved = self.db.archive_rows(before_date, batch_size)
+        print(f'Moved {moved} rows to {Database.archive_location()}')
+        if res != "success":
+            raise NameError(f"DB archive failed: {res}")
+        print(f'Archive horizon: {self.db.archive_horizon()}')
+        if vacuum and moved:
+            self.db.vacuum()
+            print('Hot DB vacuumed.')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old staging cycles")
+    parser._action_groups.pop()
+    optional = parser.add_argument_group('Optional arguments')
+    optional.add_argument("--days", type=int, default=Database.ARCHIVE_AFTER_DAYS, help="Archive cycles started more than this many days ago")
+    optional.add_argument("--batch-size", type=int, default=500, help="Rows moved per transaction")
+    optional.add_argument("--vacuum", action='store_true', help="Vacuum the hot DB after moving rows")
+    args = parser.parse_args()
+    ad = ArchiveData()
+    ad.archive_older_than(args.days, args.batch_size, args.vacuum)
+    DBMetrics.print_report()
@@ -2,17 +2,24 @@
 # Description : Main App class which generate Dashboard using streamlit & sqlite.
 
 from data import Data
+from export_data import ExportData
 from database import Database
+from db_metrics import DBMetrics
+from query_builder import QueryBuilder
 import pandas as pd
+import concurrent.futures
+import copy
 import os
 import re
+import shutil
+import tempfile
 import streamlit as st
 from streamlit_theme import st_theme
 import datetime
-from threading import Thread
-from streamlit.runtime.scriptrunner import add_script_run_ctx
 import dateutil.relativedelta as rd
+from job_queue import JobQueue
 from job_utils import JobUtils
+from link_labels import LinkLabels
 from localStyles import sticky_style,sticky_style_dark
 from template import StyleTemplate
 from streamlit_navigation_bar import st_navbar
@@ -79,17 +86,30 @@ class Dashboard:
                 'status', 'blocker_tick', 'is_promoted', 'promoted_main_build', 'details_report', 'remarks',
                 'commit_info', 'ticket_fixed', 'base_commit', 'promo_details', 'promo_status', 'release_sub_comp', 'cp_patches',
                 'release_commit', 'build_tag')
+    # table_header plus the build number, matching QueryBuilder.VIEW_COLUMNS
+    view_header = table_header + ('Build No',)
     comp_names = ('Compiler-ROCm', 'Compiler-GFX-Linux', 'Compiler-GFX-Win', 'Debugger', 'HIP-ROCm', 'LRT-GFX-Linux',
                   'LRT-GFX-Win', 'Mathlibs', 'Mathlibs-Win', 'MIOpen', 'Profiler', 'RCCL', 'ROCr', 'Release-Staging')
     release_sub_comps = ['Compiler', 'HIP', 'Debugger', 'Profiler', 'ROCr', 'Mathlibs', 'MIGraphX', 'MIOpen', 'RCCL',
                          'ROCm-SMI', 'RVS', 'Build-infra', 'Packaging', 'Others']
+    # component sections rendered on the first paint of Full Summary and Promoted Builds, the rest wait for their Load button
+    eager_sections = 3
+    # concurrent build detail fetches of the Add new entry save, shared by every session
+    fetch_workers = 6
+    # rows per keyset page on Component Staging and Modify/Delete
+    page_size = 50
+    # rows of a UI export, st.download_button holds the whole file in memory, export_data.py has no limit
+    export_max_rows = 20000
+    # login credentials, a change of its mtime rebuilds shared_resources
+    config_file = os.path.join(os.path.dirname(__file__), 'config.yaml')
 
     def __init__(self):
-        template = StyleTemplate()
+        # process-wide objects, the per-session part of a rerun starts below
+        self.build, self.fetch_pool = self.process_resources()
+        login_config, template = self.shared_resources(os.path.getmtime(self.config_file))
+        # streamlit_authenticator keeps login state in the credentials, so every session works on its own copy
+        self.login_config = copy.deepcopy(login_config)
         template.set_page_config()
-        config_file = os.path.join(os.path.dirname(__file__), 'config.yaml')
-        with open(config_file) as f:
-            self.login_config = yaml.load(f,Loader=SafeLoader)
         #page_header = ['Component Staging', 'Full Summary', 'In-Progress Staging', 'Promoted Builds', 'Admin Page']
         page_header = ['Component Staging', 'Full Summary', 'Promoted Builds', 'Admin Page', 'Staging Schedule', 'Build', 'Test']
         self.page = st_navbar(page_header,
@@ -98,7 +118,6 @@ class Dashboard:
                             logo_page='Component Staging',
                             styles=template.nav_styles,
                             options=template.nav_options,)
-        self.build = JobUtils()
         self.themeMode=st_theme()
         # initially st_theme() returns None
         if self.themeMode:
@@ -106,11 +125,32 @@ class Dashboard:
         else:
             self.themeMode = "light"
 
+    @staticmethod
+    @st.cache_resource(max_entries=1, show_spinner=False)
+    def shared_resources(config_mtime):
+        """(login config, StyleTemplate) shared by every session, built again whenever config.yaml changes,
+        config_mtime is the cache key"""
+        with open(Dashboard.config_file) as f:
+            login_config = yaml.load(f,Loader=SafeLoader)
+        return login_config, StyleTemplate()
+
+    @staticmethod
+    @st.cache_resource(show_spinner=False)
+    def process_resources():
+        """(JobUtils, build details fetch pool) built once per process, a config.yaml change does not touch them"""
+        # schema creation, migrations and the background job workers only have to be set up once per process
+        Database().create_table()
+        build = JobUtils()
+        JobQueue.register(JobUtils.PROMOTION_JOB, build.refresh_promotion)
+        JobQueue.register(JobUtils.TICKET_JOB, build.refresh_ticket_fixed)
+        JobQueue.start()
+        return build, concurrent.futures.ThreadPoolExecutor(Dashboard.fetch_workers, 'build-fetch')
+
     def main(self):
         stg_type = ('Regular Staging', 'Mainline Cherry-pick', 'Staging Cherry-pick', 'Release Cherry-pick', 'Private/Special Branch Staging')
         verdict_opt = ('GO', 'CONDITIONAL-GO', 'NO-GO', 'ABORTED', 'NOT-STARTED', 'NOT-PLANNED', 'IN-PROGRESS', 'OTHERS')
+        DBMetrics.reset_thread()
         db = Database()
-        db.create_table()
         db_size = db.db_size()
         authenticator = stauth.Authenticate(
             self.login_config['credentials'],
@@ -149,6 +189,7 @@ class Dashboard:
                         column_list=['Staging Type', 'Cycle Start Date', 'Staging Build URL', 'Cycle End/ETA', 'Staging Verdict', 'Build Promoted', 'Tickets Fixed',
                                      'Promoted Mainline Build URL', 'Detailed Report URL', 'Cherrypick Patches', 'Remarks']
                         to_filter_columns = st.multiselect("**Filter On**", column_list)
+                substring_columns=['Staging Build URL', 'Tickets Fixed', 'Promoted Mainline Build URL', 'Detailed Report URL', 'Cherrypick Patches', 'Remarks']
                 for column in to_filter_columns:
                     right, left = st.columns((20, 1))
                     left.write("⤶")
@@ -158,7 +199,7 @@ class Dashboard:
                         if len(temp)>0:
                             filters[self.header_to_db[column]]=temp
                     # substring matching columns
-                    elif column in ['Staging Build URL', 'Tickets Fixed', 'Promoted Mainline Build URL', 'Detailed Report URL', 'Cherrypick Patches', 'Remarks']:
+                    elif column in substring_columns:
                         temp=right.text_input(f"Substring in {column}")
                         if temp!="":
                             filters[self.header_to_db[column]]=temp
@@ -168,14 +209,20 @@ class Dashboard:
                         if len(temp)==1:
                             temp.append(temp[0])
                         filters[self.header_to_db[column]]=temp
-                if 'end_date' not in filters and 'start_date' not in filters:
-                    filters['start_date']=[from_date,to_date]
-                st.caption("By default, last 30 days of data will be shown below. For more data, please use 'Cycle Start Date' filter option.")
+                # substring filters are served by the full-text index, so they may search the whole history
+                substring_filter=any(self.header_to_db[c] in filters for c in substring_columns)
+                if 'end_date' not in filters and 'start_date' not in filters and substring_filter:
+                    st.caption("Substring filters search the full history. To narrow it down, please use 'Cycle Start Date' filter option.")
+                else:
+                    if 'end_date' not in filters and 'start_date' not in filters:
+                        filters['start_date']=[from_date,to_date]
+                    st.caption("By default, last 30 days of data will be shown below. For more data, please use 'Cycle Start Date' filter option.")
                 try:
-                    res, out_data = db.get_data_by_filters(filters)
+                    res, df = self.paged_df(db, db.filters_query(filters, omit=Database.DETAIL_COLUMNS).select(*QueryBuilder.VIEW_COLUMNS), 'component_staging', self.view_header, numbered=True)
                     if res!='success':
                         raise NameError("DB retrieve failed..")
-                    self.display_df(out_data,self.table_header,option['comp_name'],'Component Staging')
+                    self.display_df(df,option['comp_name'],'Component Staging',db)
+                    self.export_section(db, db.filters_query(filters), 'component_staging')
                     self.print_build_scheduler_info(option['comp_name'])
                 except Exception as e:
                     st.warning(e)
@@ -199,22 +246,23 @@ class Dashboard:
                     else:
                         buttons.append(f'''<a href=#{comp}_summary><button style="background-color:rgb(19, 23, 32); border:1px solid #BEE1E2; font-size:12px; margin:2px 1px; cursor:pointer; padding: 5px 24px; border-radius:4px; width:165px;">{comp}</button></a>''')
                 st.markdown(''.join(buttons), unsafe_allow_html=True)
-                for comp in self.comp_names:
+                st.toggle('Load all components', key='full-summary_load_all')
+                self.export_section(db, QueryBuilder().top_per('comp_name', 10), 'full_summary')
+                # last 10 of every component and their last promoted builds, one query each for the whole page
+                summary = {}
+                try:
+                    res, out_data = db.top_per_component(10, QueryBuilder().select(*QueryBuilder.VIEW_COLUMNS).omit(*Database.DETAIL_COLUMNS))
+                    if res!="success":
+                        raise NameError("DB failed to retrieve")
+                    summary = self.split_by_component(out_data, self.comp_names)
+                    _, last_promoted = db.last_promoted_builds()
+                except Exception as e:
+                    st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+                for position, comp in enumerate(summary):
                     st.markdown("")
                     st.subheader(comp,anchor=f"{comp}_summary")
-                    try:
-                        res, out_data = db.get_data_by_component_limit(comp)
-                        if res!="success":
-                            raise NameError("DB failed to retrieve")
-                        latest_promoted_build = self.get_last_promoted_build(db, comp)
-                        if latest_promoted_build:
-                            hyperlink_text=self.link_convert("staging",latest_promoted_build)
-                            st.markdown(f"Last promoted build: [{hyperlink_text}](%s)" % latest_promoted_build)
-                        else:
-                            st.markdown(f"Last promoted build: NA")
-                        self.display_df(out_data,self.table_header,comp,'full-summary')
-                    except Exception as e:
-                        st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+                    latest_promoted_build = last_promoted[comp][1] if comp in last_promoted else ''
+                    self.component_section(comp,summary[comp],'full-summary',position,latest_promoted_build)
             else:
                 st.info('Database is Empty.', icon="ℹ️")
 
@@ -229,18 +277,20 @@ class Dashboard:
                 st.markdown(f'''<a href=#in-progress-staging-cycle-details><button style="{sticky_style_dark}">&#8593;</button></a>''',unsafe_allow_html=True)
             if db_size > 0:
                 buttons = []
-                for comp in self.comp_names:
+                summary = {}
+                try:
+                    query = QueryBuilder().select(*QueryBuilder.VIEW_COLUMNS).where_eq('status', 'IN-PROGRESS').omit(*Database.DETAIL_COLUMNS)
+                    res, out_data = db.top_per_component(10, query)
+                    if res!="success":
+                        raise NameError("DB failed to retrieve")
+                    summary = self.split_by_component(out_data, self.comp_names)
+                except Exception as e:
+                    st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+                for comp, df in summary.items():
                     try:
-                        option = {
-                            'comp_name': comp,
-                            'status': 'IN-PROGRESS'
-                        }
-                        res, out_data = db.get_data_by_two_elements(option)
-                        if res!="success":
-                            raise NameError("DB failed to retrieve")
-                        if out_data:
+                        if len(df):
                             st.subheader(comp)
-                            self.display_df(out_data,self.table_header,option['comp_name'],'in-progress')
+                            self.display_df(df,comp,'in-progress')
                     except Exception as e:
                         st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
             else:
@@ -264,21 +314,22 @@ class Dashboard:
                     else:
                         buttons.append(f'''<a href=#{comp}_promoted><button style="background-color:rgb(19, 23, 32); border:1px solid #BEE1E2; font-size:12px; margin:2px 1px; cursor:pointer; padding: 5px 24px; border-radius:4px; width:165px;">{comp}</button></a>''')
                 st.markdown(''.join(buttons), unsafe_allow_html=True)
-                for comp in comp_names_promoted:
-                    try:
-                        option = {
-                            'comp_name': comp,
-                            'is_promoted': 'Yes'
-                        }
-                        res, out_data = db.get_data_by_two_elements(option)
-                        if res!="success":
-                            raise NameError("DB failed to retrieve")
-                        st.subheader(comp,anchor=f"{comp}_promoted")
-                        if out_data:
-                            out_data=[ele for ele in out_data if "Regular Staging" in ele[1]]
-                        self.display_df(out_data,self.table_header,option['comp_name'],'promoted-builds')
-                    except Exception as e:
-                        st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+                st.toggle('Load all components', key='promoted-builds_load_all')
+                # the export takes the page's rows, Regular Staging cycles of the listed components out of the top 10 promoted
+                self.export_section(db, Database.latest_promoted_query(10), 'promoted_builds',
+                                    lambda row: row['comp_name'] in comp_names_promoted and 'Regular Staging' in row['stg_type'])
+                summary = {}
+                try:
+                    res, out_data = db.latest_promoted_per_component(10, QueryBuilder().select(*QueryBuilder.VIEW_COLUMNS).omit(*Database.DETAIL_COLUMNS))
+                    if res!="success":
+                        raise NameError("DB failed to retrieve")
+                    summary = self.split_by_component(out_data, comp_names_promoted)
+                except Exception as e:
+                    st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+                for position, (comp, df) in enumerate(summary.items()):
+                    st.subheader(comp,anchor=f"{comp}_promoted")
+                    df=df[df['Staging Type'].str.contains('Regular Staging',regex=False)].reset_index(drop=True)
+                    self.component_section(comp,df,'promoted-builds',position)
             else:
                 st.info('Database is Empty.', icon="ℹ️")
 
@@ -311,6 +362,7 @@ class Dashboard:
                     st.button("Modify/Delete", on_click=clickButton, args=['modify'])
                 if st.session_state.newEntry:
                     st.write('''<p style="font-size:20px;"><b>Add new entry</b></p>''', unsafe_allow_html=True)
+                    self.ticket_fixed_status(db)
                     build_tag = ''
                     input = {}
                     input['comp_name'] = st.selectbox('**Select Staging Component**', ('--select--',) + self.comp_names)
@@ -320,7 +372,6 @@ class Dashboard:
                     stg_type_inp = self.generate_new_stg_type(input['comp_name'], stg_type)
                     input['stg_type'] = st.selectbox('**Select Staging Type**', ('--select--',) + stg_type_inp)
                     input['build_url'] = st.text_input('**Staging Build URL** 🔗', '')
-                    build_url_inp = input['build_url']
                     input['request_date'] = st.date_input('**Requested Date** 📅', "today")
                     input['start_date'] = st.date_input('**Cycle Start Date** 📅', "today")
                     input['code_date'] = st.date_input('**Codebase Date** 📅', "today")
@@ -349,9 +400,6 @@ class Dashboard:
                             build_tag = f"{input['comp_name'].lower()}_{build_no}"
                             if 'Weekly' in input['stg_type']:
                                 build_tag = f"{input['comp_name'].lower()}_{build_no}_weekly"
-                            input['build_url'] = f"""<a href="{input['build_url']}">{input['build_url']}</a>"""
-                            input['mainline_url'] = f"""<a href="{input['mainline_url']}">{input['mainline_url']}</a>"""
-                            input['details_report'] = f"""<a href="{input['details_report']}">{input['details_report']}</a>"""
                             input['commit_info'] = ''
                             input['ticket_fixed'] = ''
                             input['base_commit'] = ''
@@ -359,23 +407,22 @@ class Dashboard:
                             input['promo_status'] = ''
                             input['cp_patches'] = ''
                             input['release_commit'] = ''
-                            if input['comp_name'] in self.build.comp_manifest_map.keys():
-                                input['commit_info'] = self.build.get_commit_from_build(build_url_inp, input['comp_name'])
-                                input['base_commit'] = self.build.get_commit_from_base_build(build_url_inp, input['comp_name'])
-                                input['cp_patches'] = self.build.get_cherrypick_patches_from_build(build_url_inp)
-                            if input['comp_name'] == 'Mathlibs':
-                                input['promo_status'] = self.upload_commit_status_info(db, False, build_tag, list(input.values()))
-                            if input['comp_name'] == 'Release-Staging':
-                                input['release_commit'] = self.build.get_commit_diff_for_release_stg(input['commit_info'], input['base_commit'])
                             st.markdown("####")
+                            # the row lands first, the build details are fetched afterwards and stored column by column
                             data = Data(*[build_tag] + list(input.values()))
                             res = db.insert_data(data)
-                            if input['comp_name'] in self.build.comp_manifest_map.keys() and input['comp_name'] != 'Release-Staging':
-                                t = Thread(target=self.fetch_ticket_info_from_gitlog, args=(build_tag, db))
-                                add_script_run_ctx(t)
-                                t.start()
                             if res != "success":
                                 raise NameError("DB insert failed..")
+                            errors = []
+                            if input['comp_name'] in self.build.comp_manifest_map.keys():
+                                errors = self.fetch_build_details(db, build_tag, input)
+                            if input['comp_name'] in self.build.comp_manifest_map.keys() and input['comp_name'] != 'Release-Staging':
+                                self.queue_ticket_fixed(db, build_tag)
+                            if errors:
+                                # the entry is saved, only the listed details are missing
+                                for error in errors:
+                                    st.warning(f"Build details not saved, {error}", icon="⚠️")
+                                return
                             st.session_state.isSaved=True
                             st.rerun()
                         except UnboundLocalError as e:
@@ -417,17 +464,12 @@ class Dashboard:
                                 from_date = dateRange[0]
                                 to_date = dateRange[1]
                             st.markdown("#####")
-                            res, out_data = db.get_data_by_element('comp_name', option, from_date, to_date)
+                            query = QueryBuilder().where_eq('comp_name', option).where_range('start_date', from_date, to_date)
+                            res, df = self.paged_df(db, query, 'modify', self.table_header, dates=['end_date'])
                             if res!='success':
                                 raise NameError("DB retrieve failed..")
-                            df = pd.DataFrame(list(out_data), columns=self.table_header)
                             if option != 'Release-Staging':
                                 df.pop('Sub Components')
-                            df['Cycle End/ETA']=pd.to_datetime(df['Cycle End/ETA'])
-                            for index,row in df.iterrows():
-                                df.at[index,'Staging Build URL']=row['Staging Build URL'].split("\"")[1]
-                                df.at[index,'Promoted Mainline Build URL']=row['Promoted Mainline Build URL'].split("\"")[1]
-                                df.at[index,'Detailed Report URL']=row['Detailed Report URL'].split("\"")[1]
                             result=st.data_editor(df,column_config=df_column_config,disabled=disabledList,num_rows='dynamic',hide_index=True)
                             if st.button('**Save** ⏬', use_container_width=True):
                                 result['Cycle End/ETA']=result['Cycle End/ETA'].astype(str)
@@ -441,7 +483,6 @@ class Dashboard:
                                     st.toast("Changes saved",icon="✅")
                                     st.session_state.isSaved=False
                             self.upload_promoted_commit_info(db)
-                            self.upload_commit_status_info(db)
                         except Exception as e:
                             st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
                     else:
@@ -464,6 +505,24 @@ class Dashboard:
         if self.page == 'Test':
             st.subheader('Test')
 
+        # append ?db_metrics=1 to the URL to see where the database time of this page goes
+        if st.query_params.get('db_metrics'):
+            self.print_db_metrics()
+
+    def print_db_metrics(self):
+        calls, total_ms = DBMetrics.thread_totals()
+        with st.expander(f"Database time of this page: {total_ms:.1f} ms in {calls} calls"):
+            entries, hits, misses = Database.cache_stats()
+            st.caption(f"Result cache: {entries} entries, {hits} hits, {misses} misses")
+            st.markdown("**Per method (since app start)**")
+            st.dataframe(pd.DataFrame(DBMetrics.report()), hide_index=True)
+            slow = DBMetrics.slow_queries()
+            st.markdown(f"**Slow queries (>= {DBMetrics.SLOW_MS:g} ms)**")
+            if slow:
+                st.dataframe(pd.DataFrame(slow).drop(columns=['type']), hide_index=True)
+            else:
+                st.caption('None so far.')
+
     def print_build_scheduler_info(self, comp_name, skip_print=False):
         if comp_name != 'Release-Staging' and 'Win' not in comp_name:
             if not skip_print:
@@ -528,138 +587,165 @@ class Dashboard:
             st.dataframe(df, column_config=temp_config, hide_index=True)
 
     def modify_db(self,result,df,db):
-        # list of deleted 'Build Tag' rows
-        deleted=[]
-        # list of modified rows 
-        modified=[]
+        # rows are aligned on 'Build Tag', deleted rows and changed cells come out of one vectorized comparison
         try:
-            for index,row in df.iterrows():
-                if not row['Build Tag'] in result['Build Tag'].tolist():
-                    deleted.append(row['Build Tag'])
-                    continue
-                diff=row.compare(result.loc[result['Build Tag']==row['Build Tag']].iloc[0])
-                if not diff.empty:
-                    temp_dict={self.header_to_db['Build Tag']:row['Build Tag']}
-                    for i,v in diff.iterrows():
-                        if i=="Promoted Mainline Build URL" or i=="Detailed Report URL":
-                            if not self.build.is_url(v.iloc[1]):
-                                raise NameError("Invaid URL")
-                            v.iloc[1]=f"""<a href="{v.iloc[1]}">{v.iloc[1]}</a>"""
-                        temp_dict[self.header_to_db[i]]=v.iloc[1]
-                    modified.append(temp_dict)
-            res=db.update_db(deleted,modified)
+            old=df.set_index('Build Tag')
+            kept=result['Build Tag'].isin(old.index)
+            # 'Build Tag' is read-only, so rows added in the editor have none and can not be saved from here
+            if (~kept).any():
+                st.info(f"{(~kept).sum()} added row(s) ignored, use 'Add new entry' to create entries.")
+            new=result[kept].set_index('Build Tag')[old.columns]
+            # list of deleted 'Build Tag' rows
+            deleted=old.index[~old.index.isin(new.index)].tolist()
+            old=old.loc[new.index]
+            # a cell changed unless both sides are equal or both are missing, as DataFrame.compare does
+            changed=(old!=new)&~(old.isna()&new.isna())
+            for column in ('Promoted Mainline Build URL','Detailed Report URL'):
+                urls=new.loc[changed[column],column].map(str)
+                invalid=~(urls.str.startswith('http')|(urls==''))
+                if invalid.any():
+                    raise NameError(f"Invaid URL for {', '.join(invalid.index[invalid])}")
+            # list of modified rows, only the changed columns of each
+            modified={}
+            values=new.to_numpy()
+            for i,j in zip(*changed.to_numpy().nonzero()):
+                tag=new.index[i]
+                modified.setdefault(tag,{self.header_to_db['Build Tag']:tag})[self.header_to_db[new.columns[j]]]=values[i,j]
+            res=db.update_db(deleted,list(modified.values()))
             if res!="success":
                 raise NameError("DB commit failed")
         except Exception as e:
             st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
 
+    def export_section(self, db, query, key, keep=None):
+        # the export is streamed chunk by chunk into a temporary file by this session's own script thread
+        with st.expander('Export'):
+            st.caption(f"Exports here stop at {self.export_max_rows} rows. For the full history, run export_data.py on the server.")
+            fmt_col, explode_col, button_col = st.columns((4, 8, 4))
+            fmt = fmt_col.selectbox('Format', ExportData.FORMATS, key=f'{key}_export_format', label_visibility='collapsed')
+            explode = explode_col.checkbox('Manifests as one row per project', key=f'{key}_export_explode')
+            if not button_col.button('Prepare export', key=f'{key}_export', use_container_width=True):
+                return
+            export_dir = tempfile.mkdtemp(prefix='cqe_export_')
+            try:
+                path = os.path.join(export_dir, f'{key}.{fmt}')
+                status = st.empty()
+                written = ExportData(db).export(query, path, fmt, explode, lambda rows: status.caption(f'{rows} rows written..'), keep,
+                                                self.export_max_rows)
+                status.caption(f'{written} rows exported' + (', the limit was reached.' if written >= self.export_max_rows else '.'))
+                for file in [path] + ([ExportData.commits_path(path)] if explode else []):
+                    with open(file, 'rb') as f:
+                        st.download_button(f'Download {os.path.basename(file)}', f, file_name=os.path.basename(file), key=f'{key}_{os.path.basename(file)}')
+            except Exception as e:
+                st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+            finally:
+                shutil.rmtree(export_dir, ignore_errors=True)
+
     def get_last_promoted_build(self, db, comp):
-        option = {
-            'comp_name': comp,
-            'is_promoted': 'Yes'
-        }
-        _,last_promoted_build = db.get_data_by_two_elements(option)
-        last_promoted_build = [ele for ele in last_promoted_build if "Regular Staging" in ele[1]]
-        if last_promoted_build:
-            last_promoted_build = last_promoted_build[0][3].split("\"")[1]
-            last_promoted_build = last_promoted_build[:-1] if last_promoted_build[-1] == '/' else last_promoted_build
-        return last_promoted_build
+        # kept current by the database on every write, see Database.create_last_promoted
+        _,last_promoted = db.get_last_promoted(comp)
+        return last_promoted[1] if last_promoted else ''
+
+    def fetch_build_details(self, db, build_tag, input):
+        # manifest, base build manifest and cherry-pick patches are independent, they are fetched concurrently and each
+        # column is stored as soon as its fetch returns, the save then takes as long as the slowest fetch
+        build_url = input['build_url']
+        fetches = {self.fetch_pool.submit(self.build.get_commit_from_build, build_url, input['comp_name']): 'commit_info',
+                   self.fetch_pool.submit(self.build.get_commit_from_base_build, build_url, input['comp_name']): 'base_commit',
+                   self.fetch_pool.submit(self.build.get_cherrypick_patches_from_build, build_url): 'cp_patches'}
+        steps = len(fetches) + 1
+        progress = st.progress(0.0, text='Fetching build details..')
+        errors = []
+        for done, future in enumerate(concurrent.futures.as_completed(fetches), 1):
+            column = fetches[future]
+            try:
+                input[column] = future.result()
+                res = db.add_entry(build_tag, column, input[column])
+                if res != "success":
+                    errors.append(f"{column}: {res}")
+            except Exception as e:
+                errors.append(f"{column}: {e}")
+            progress.progress(done / steps, text=f'Fetched {column} ({done}/{len(fetches)})..')
+        # derived from the staging and base commits once both are in
+        column = None
+        if input['comp_name'] == 'Mathlibs':
+            column = 'promo_status'
+            input[column] = self.upload_commit_status_info(db, build_tag)
+        try:
+            if input['comp_name'] == 'Release-Staging':
+                # the same diff update_commit_details.py backfills, over the manifests stored above
+                column = 'release_commit'
+                input[column] = self.build.get_commit_diff_for_release_stg(db, build_tag)
+            if column is not None:
+                res = db.add_entry(build_tag, column, input[column])
+                if res != "success":
+                    errors.append(f"{column}: {res}")
+        except Exception as e:
+            errors.append(f"{column}: {e}")
+        progress.progress(1.0, text='Build details saved.')
+        return errors
 
     def upload_promoted_commit_info(self, db):
-        # Currently this feature is supported only for Mathlibs
+        # Currently this feature is supported only for Mathlibs, JobQueue workers refetch the builds whose inputs changed
         try:
-            comp_name = 'Mathlibs'
             option = {
-                'comp_name': comp_name,
+                'comp_name': 'Mathlibs',
                 'is_promoted': 'Yes'
             }
-            res, out_data = db.get_data_by_two_elements(option)
+            res, out_data = db.select(QueryBuilder.by_elements(option))
             if res != "success":
                 raise NameError("DB failed to retrieve")
-            for out in out_data:
-                promo_commit = self.build.get_promoted_build_commits(out, comp_name)
-                res2 = db.add_entry(out[-1], 'promo_details', promo_commit)
-                if res2 != "success":
-                    raise NameError("DB commit failed")
+            res, _ = JobQueue.submit(db, JobUtils.PROMOTION_JOB, [(out[-1], self.build.promotion_input_hash(out)) for out in out_data])
+            if res != "success":
+                raise NameError("DB commit failed")
+            counts, failed = JobQueue.status(db, JobUtils.PROMOTION_JOB)
+            st.caption(f"Mathlibs promoted details refresh: {counts.get('queued',0)} queued, {counts.get('running',0)} running, "
+                       f"{counts.get('done',0)} up to date, {len(failed)} failed.")
+            if failed:
+                with st.expander('Failed promoted details refresh'):
+                    for build_tag, error in failed:
+                        st.markdown(f"**{build_tag}**: {error}")
         except Exception as e:
             st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
 
-    def upload_commit_status_info(self, db, is_promo=True, build_tag='', input=[]):
-        # Currently this feature is supported only for Mathlibs
+    def upload_commit_status_info(self, db, build_tag=''):
+        # Currently this feature is supported only for Mathlibs, promoted builds are refreshed by upload_promoted_commit_info
         try:
-            if not is_promo:
-                option = {
-                    'comp_name': input[0],
-                    'build_tag': build_tag
-                }
-                return self.build.get_promoted_status_info(input, is_promo)
-            else:
-                option = {
-                    'comp_name': 'Mathlibs',
-                    'is_promoted': 'Yes'
-                }
-                res, out_data = db.get_data_by_two_elements(option)
-                if res != "success":
-                    raise NameError("DB failed to retrieve")
-                for out in out_data:
-                    diff_str = self.build.get_promoted_status_info(out, is_promo)
-                    res2 = db.add_entry(out[-1], 'promo_status', diff_str)
-                    if res2 != "success":
-                        raise NameError("DB commit failed")
+            return self.build.get_promoted_status_info(db, build_tag, False)
         except Exception as e:
             st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
 
-    def fetch_ticket_info_from_gitlog(self, build_tag, db):
+    def queue_ticket_fixed(self, db, build_tag):
+        # the git log extraction runs on the JobQueue workers, one per repo checkout at a time, and survives restarts
         try:
-            res, out_data = db.get_data_by_element('build_tag', build_tag)
+            res, out_data = db.select(QueryBuilder.by_elements({'build_tag': build_tag}))
             if res != "success":
                 raise NameError("DB failed to retrieve")
-            for out in out_data:
-                if out[0] not in list(self.build.gerrit_projects):
-                    ticket_str = 'Not Supported'
-                elif 'Win' in out[0]:
-                    ticket_str = 'Not Supported'
-                elif 'Regular Staging' not in out[1]:
-                    ticket_str = 'NA'
-                else:
-                    last_promoted_build = self.get_last_promoted_build(db, out[0])
-                    ticket_str = self.build.get_ticket_info_from_gitlog(out, last_promoted_build)
-                if ticket_str != '':
-                    res2 = db.add_entry(out[-1], 'ticket_fixed', ticket_str)
-                    if res2 != "success":
-                        raise NameError("DB commit failed")
+            jobs = [(out[-1], self.build.ticket_input_hash(out, self.get_last_promoted_build(db, out[0])), self.build.ticket_lock_key(out[0]))
+                    for out in out_data]
+            res, _ = JobQueue.submit(db, JobUtils.TICKET_JOB, jobs)
+            if res != "success":
+                raise NameError("DB commit failed")
+        except Exception as e:
+            st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+
+    def ticket_fixed_status(self, db):
+        # tickets fixed are extracted after the save returned, failures are retried on the next visits and shown until a retry passes
+        try:
+            JobQueue.retry_failed(db, JobUtils.TICKET_JOB)
+            counts, failed = JobQueue.status(db, JobUtils.TICKET_JOB)
+            if counts.get('queued',0) or counts.get('running',0):
+                st.caption(f"Tickets fixed extraction: {counts.get('queued',0)} queued, {counts.get('running',0)} running.")
+            for build_tag, error in failed:
+                # the first line, errors raised by a handler carry their traceback after it
+                st.warning(f"Tickets fixed not extracted for {build_tag}, {str(error).splitlines()[0]}", icon="⚠️")
         except Exception as e:
             st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
 
     def link_convert(self, type, val):
+        # labels come from the memoized rule table, shared by every session of this process
         if("http" in str(val)):
-            val=str(val)
-            if val[-1]=='/':
-                val=val[:-1]
-            if type=="staging":
-                try:
-                    if "rt" in val.split('-'):
-                        return f"rt-win/{val.split('/')[-1]}"
-                    elif re.search("rel.*component-staging",val):
-                        return f"release-staging/{val.split('/')[-1]}"
-                    elif "cpl" in val.split('-'):
-                        return f"cpl-win/{val.split('/')[-1]}"
-                    elif "afar" in val.split('-'):
-                        return f"afar-profiler/{val.split('/')[-1]}"
-                    elif "compute-psdb-no-npi" in val:
-                        return f"compute-psdb/{val.split('/')[-1]}"
-                    elif val.split('-')[-1]:
-                        return val.split('-')[-1]
-                except Exception as e:
-                    st.warning(f"Something went wrong Error\:{e}", icon="⚠️") 
-            elif type=="promoted":
-                try:
-                    if "compute-rocm-dkms-no-npi-hipclang" in val.split('/'):
-                        return f"mainline/{val.split('/')[-1]}"
-                    elif "rel" in val.split('-'):
-                        return f"release/{val.split('/')[-1]}"
-                except Exception as e:
-                    st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+            return LinkLabels.label(type,str(val))
         return val
 
     def generate_new_stg_type(self, comp_name, stg_type):
@@ -695,34 +781,80 @@ class Dashboard:
         return False
 
     # preprocess data from db, format it and display it
-    def display_df(self,out_data,table_header,comp,tab_name):
-        out_data=[list(ele) for ele in out_data] 
-        for i,v in enumerate(out_data):
-            out_data[i].insert(0,i+1)
-        table_header_list=list(table_header)
-        table_header_list.insert(0,"Index")
-        df = pd.DataFrame(list(out_data), columns=table_header_list)
-        # remove columns from ui and perform a deep copy before to save information regarding commit info, promoted status, etc.
-        og_df=df.copy()
+    def paged_df(self, db, query, key, headers, numbered=False, dates=()):
+        """fetch the current keyset page of query for view `key` as a DataFrame (Database.select_df) and render
+        prev/next controls, numbered adds the Index column counted across pages, returns (status, df)"""
+        pager = db.pages(query, self.page_size)
+        sql, params = query.build()
+        # start over from the first page whenever the filters change
+        if st.session_state.get(f"{key}_page_query") != (sql, params):
+            st.session_state[f"{key}_page_query"] = (sql, params)
+            st.session_state[f"{key}_page_keys"] = [None]
+        page_keys = st.session_state[f"{key}_page_keys"]
+        offset = (len(page_keys) - 1) * self.page_size
+        res, df = db.select_df(pager.page_query(after=page_keys[-1]), headers, offset if numbered else None, dates)
+        if res != "success":
+            return res, df
+        has_next = len(df) > self.page_size
+        df.drop(df.index[self.page_size:], inplace=True)
+        # the query columns are the last ones of the frame, after the Index column
+        last = df.iloc[-1].tolist()[-len(query.columns):] if len(df) else None
+        def next_page():
+            page_keys.append(pager.key(last))
+        def prev_page():
+            page_keys.pop()
+        prev_col, info_col, next_col = st.columns((2, 12, 2))
+        prev_col.button("◀ Prev", key=f"{key}_prev", on_click=prev_page, disabled=len(page_keys) == 1, use_container_width=True)
+        info_col.caption(f"Page {len(page_keys)}, rows {offset + 1 if len(df) else 0}-{offset + len(df)}")
+        next_col.button("Next ▶", key=f"{key}_next", on_click=next_page, disabled=not has_next, use_container_width=True)
+        return res, df
+
+    @st.fragment
+    def component_section(self, comp, df, tab_name, position, latest_promoted_build=None):
+        # one fragment per component, a click inside a section reruns only that section with the frame of the last full run
+        loaded = f'{tab_name}_{comp}_loaded'
+        if position >= self.eager_sections and not st.session_state.get(loaded) and not st.session_state.get(f'{tab_name}_load_all'):
+            # sections below the first few are rendered once asked for, so the first paint does not wait for all of them
+            if not st.button(f'Load {comp}', key=f'{loaded}_button'):
+                return
+            st.session_state[loaded] = True
+        try:
+            if latest_promoted_build is not None:
+                if latest_promoted_build:
+                    hyperlink_text=self.link_convert("staging",latest_promoted_build)
+                    st.markdown(f"Last promoted build: [{hyperlink_text}](%s)" % latest_promoted_build)
+                else:
+                    st.markdown(f"Last promoted build: NA")
+            # display_df reshapes its frame in place and fragment reruns get the same frame again
+            self.display_df(df.copy(),comp,tab_name)
+        except Exception as e:
+            st.warning(f"Something went wrong Error\:{e}", icon="⚠️")
+
+    def split_by_component(self, out_data, comp_names):
+        # one frame per component out of a top_per_component result, components without rows get an empty one
+        df = Database.to_frame(out_data, QueryBuilder.VIEW_COLUMNS, self.view_header)
+        groups = dict(tuple(df.groupby('Component', sort=False)))
+        return {comp: groups[comp].reset_index(drop=True) if comp in groups else df.iloc[0:0].copy() for comp in comp_names}
+
+    def display_df(self,df,comp,tab_name,db=None):
+        # Component Staging pages come numbered from their offset (select_df index_start), the other views are numbered here
+        if 'Index' not in df.columns:
+            df.insert(0,'Index',range(1,len(df)+1))
+        # remove columns from ui, the commit details panel reads them by build tag
         df.pop('Commit Info')
         df.pop('Base Commit Info')
         df.pop('Promoted Details')
         df.pop('Promoted Status')
         df.pop('Cherrypick Patches')
         df.pop('Release Commit Info')
-        for index,row in df.iterrows():
-            df.at[index,'Staging Build URL']=row['Staging Build URL'].split("\"")[1]
-            df.at[index,'Promoted Mainline Build URL']=row['Promoted Mainline Build URL'].split("\"")[1]
-            df.at[index,'Detailed Report URL']=row['Detailed Report URL'].split("\"")[1]
-            # remove trailing / from url if present and extract build_no
-            temp_build_no=str(df.at[index,'Staging Build URL'])[:-1].split('/')[-1] if str(df.at[index,'Staging Build URL'])[-1]=='/' else str(df.at[index,'Staging Build URL']).split('/')[-1]
-            # inject component type and build no into url
-            df.at[index,'Issues Found']=f"https://ontrack-internal.amd.com/issues/?filter=-4&jql=%22Build%20Where%20Found%22%20~%20%22{self.comp_to_jira[comp]+str(temp_build_no)}%22%20ORDER%20BY%20priority%20DESC"
-            if str(df.at[index,'Tickets Fixed']) != '' and str(df.at[index,'Tickets Fixed']) != 'NA' and str(df.at[index,'Tickets Fixed']) != 'None' and str(df.at[index,'Tickets Fixed']) != 'Not Supported':
-                tick_str = '%2C'.join(str(df.at[index,'Tickets Fixed']).split(','))
-                df.at[index,'Tickets Fixed']=f"https://ontrack-internal.amd.com/issues/?jql=key%20in%20({tick_str})"
-            else:
-                df.at[index,'Tickets Fixed'] = str(df.at[index,'Tickets Fixed'])
+        # build_no is stored with the row, missing ones render as ''
+        build_no=df.pop('Build No').astype('Int64').astype('string').fillna('').astype(str)
+        # inject component type and build no into url, whole columns at once
+        df['Issues Found']=("https://ontrack-internal.amd.com/issues/?filter=-4&jql=%22Build%20Where%20Found%22%20~%20%22"
+                            +self.comp_to_jira[comp]+build_no+"%22%20ORDER%20BY%20priority%20DESC")
+        tickets=df['Tickets Fixed'].map(str)
+        has_tickets=~tickets.isin(['','NA','None','Not Supported'])
+        df['Tickets Fixed']=tickets.where(~has_tickets,"https://ontrack-internal.amd.com/issues/?jql=key%20in%20("+tickets.str.replace(',','%2C',regex=False)+")")
         temp_link_config=dict(self.link_config)
         # format dataframe columns with links to hyperlinks
         temp_link_config['Commit Details']=st.column_config.CheckboxColumn()
@@ -764,7 +896,7 @@ class Dashboard:
                 df.insert(13,'Tickets Fixed',df.pop('Tickets Fixed'))
                 df.insert(13,'Planned/Requested Date',df.pop('Planned/Requested Date'))
                 df.insert(13,'Codebase Date',df.pop('Codebase Date'))
-        styled_df=self.format_df(df,comp)
+        styled_df=self.format_df(df,comp,build_no)
         if tab_name=='Component Staging':
             disabled_column_names=list(df.keys())
             disabled_column_names.remove('Commit Details')
@@ -773,75 +905,69 @@ class Dashboard:
                                        disabled=disabled_column_names,
                                        hide_index=True)
             selected_rows=selected_rows.loc[selected_rows['Commit Details']==True]
-            if len(selected_rows):
-                # Toast message whenever user selects another row
-                # st.toast(f"Scroll down to view detailed info")
-                column_head = ['ProjectName','ProjectPath','BranchName','CommitId']
-                if comp == "Mathlibs":
-                    for i in selected_rows.index:
-                        det_list=self.build.format_manifest_data(str(og_df.at[i,'Promoted Status']))
-                        if bool(det_list):
-                            column_head = ['Component', 'StagingCommit', 'StagingBranch', 'StagingRemoteName', 'StagingRequest?', 'Promoted?']
-                            st.markdown(f"**Detailed Info for:** [{self.link_convert('staging',selected_rows.at[i,'Staging Build URL'])}]({selected_rows.at[i,'Staging Build URL']})")
-                            detailed_df=pd.DataFrame(det_list,columns=column_head)
-                            def highlight_bool(col):
-                                if col=='Yes':
-                                    return 'color: #20bd49'
-                                elif col=='No':
-                                    return 'color: red'
-                            st.dataframe(detailed_df.style.applymap(highlight_bool,subset=["StagingRequest?","Promoted?"]),hide_index=True)
-                elif comp == "Release-Staging":
-                    for i in selected_rows.index:
-                        det_list=self.build.format_manifest_data(str(og_df.at[i,'Release Commit Info']), skip_remote=True)
-                        if bool(det_list):
-                            st.markdown(f"**Detailed Info for:** [{self.link_convert('staging',selected_rows.at[i,'Staging Build URL'])}]({selected_rows.at[i,'Staging Build URL']})")
-                            detailed_df=pd.DataFrame(det_list,columns=column_head)
-                            st.dataframe(detailed_df,hide_index=True)
-                else:
-                    for i in selected_rows.index:
-                        det_list=self.build.format_manifest_data(str(og_df.at[i,'Commit Info']), skip_remote=True)
-                        st.markdown(f"**Detailed Info for:** [{self.link_convert('staging',selected_rows.at[i,'Staging Build URL'])}]({selected_rows.at[i,'Staging Build URL']})")
-                        detailed_df=pd.DataFrame(det_list,columns=column_head)
-                        st.dataframe(detailed_df,hide_index=True)
-                if str(og_df.at[i,'Cherrypick Patches']) != '' and str(og_df.at[i,'Cherrypick Patches']) != 'None':
-                    st.markdown(f"**Cherry-Pick patches for:** [{self.link_convert('staging',selected_rows.at[i,'Staging Build URL'])}]({selected_rows.at[i,'Staging Build URL']})")
-                    for patch in og_df.at[i,'Cherrypick Patches'].split('\n'):
-                        st.markdown(patch)
-                st.markdown('')
+            # details are fetched by build tag only for the ticked rows, nothing is read when none is ticked
+            for i in selected_rows.index:
+                self.print_commit_details(db,comp,selected_rows.at[i,'Build Tag'],selected_rows.at[i,'Staging Build URL'])
         else:
             st.dataframe(styled_df,
                          column_config=temp_link_config,
                          hide_index=True)
 
-    def format_df(self,df,comp):
+    # manifest kind and (column, header) pairs shown in the commit details panel, per component
+    commit_details_view = {
+        'Mathlibs': ('status', (('project','Component'),('commit_id','StagingCommit'),('branch','StagingBranch'),('remote','StagingRemoteName'),
+                                ('staging_request','StagingRequest?'),('promoted','Promoted?'))),
+        'Release-Staging': ('release', (('project','ProjectName'),('path','ProjectPath'),('branch','BranchName'),('commit_id','CommitId'))),
+        None: ('staging', (('project','ProjectName'),('path','ProjectPath'),('branch','BranchName'),('commit_id','CommitId')))
+    }
+
+    def print_commit_details(self,db,comp,build_tag,build_url):
+        kind,view=self.commit_details_view.get(comp,self.commit_details_view[None])
+        # parsed once per build and database version, shared by every session
+        res,detailed_df=db.build_commits_df(build_tag,kind,[c for c,_ in view],[h for _,h in view])
+        if res!='success':
+            st.warning(f'Commit details of {build_tag} could not be read: {res}', icon="⚠️")
+        # Mathlibs and Release-Staging builds without manifest rows show nothing
+        elif len(detailed_df) or kind=='staging':
+            st.markdown(f"**Detailed Info for:** [{self.link_convert('staging',build_url)}]({build_url})")
+            if kind=='status':
+                def highlight_bool(col):
+                    return col.map({'Yes':'color: #20bd49','No':'color: red'}).fillna('')
+                st.dataframe(detailed_df.style.apply(highlight_bool,subset=["StagingRequest?","Promoted?"]),hide_index=True)
+            else:
+                st.dataframe(detailed_df,hide_index=True)
+        _,cp_patches=db.get_build_detail(build_tag,'cp_patches')
+        if str(cp_patches) != '' and str(cp_patches) != 'None':
+            st.markdown(f"**Cherry-Pick patches for:** [{self.link_convert('staging',build_url)}]({build_url})")
+            for patch in cp_patches.split('\n'):
+                st.markdown(patch)
+        st.markdown('')
+
+    def format_df(self,df,comp,build_no):
+        # display labels are computed per column and applied by row position, the same url can carry another build's label
+        def has_link(column):
+            return df[column].map(str).str.contains('http',regex=False)
+        promoted_column='Promoted Release Build URL' if comp=='Release-Staging' else 'Promoted Mainline Build URL'
+        tickets=df['Tickets Fixed'].map(str)
+        labels={'Staging Build URL':(self.link_convert('staging',val) for val in df['Staging Build URL']),
+                promoted_column:(self.link_convert('promoted',val) for val in df[promoted_column]),
+                'Detailed Report URL':(build_no+'_Report').where(has_link('Detailed Report URL'),''),
+                'Issues Found':(self.comp_to_jira[comp]+build_no).where(has_link('Issues Found'),''),
+                'Tickets Fixed':(build_no+'_tickets').where(has_link('Tickets Fixed'),tickets.where(tickets.isin(['NA','None','Not Supported']),''))}
         styledDf=df.style
-        # need another function returning lambda as lambda only uses latest value of variable
-        def lambdaFunc(val):
-            return lambda x: val if "http" in x else ""
-        def format_ticket_fixed(val):
-            return lambda x: val if "http" in x else 'NA' if x == 'NA' else 'None' if x == 'None' else 'Not Supported' if x == 'Not Supported' else ''
-        for i,row in df.iterrows():
-            buildNo=str(row['Staging Build URL'])[:-1].split('/')[-1] if str(row['Staging Build URL'])[-1]=='/' else str(row['Staging Build URL']).split('/')[-1]
-            styledDf._display_funcs[(i,df.columns.get_loc('Staging Build URL'))]=lambda x: self.link_convert("staging",x)
-            if comp=='Release-Staging':
-                styledDf._display_funcs[(i,df.columns.get_loc('Promoted Release Build URL'))]=lambda x: self.link_convert("promoted",x)
-            else:    
-                styledDf._display_funcs[(i,df.columns.get_loc('Promoted Mainline Build URL'))]=lambda x: self.link_convert("promoted",x)
-            styledDf._display_funcs[(i,df.columns.get_loc('Detailed Report URL'))]=lambdaFunc(f"{buildNo}_Report")
-            styledDf._display_funcs[(i,df.columns.get_loc('Issues Found'))]=lambdaFunc(f"{self.comp_to_jira[comp]+str(buildNo)}")
-            styledDf._display_funcs[(i,df.columns.get_loc('Tickets Fixed'))] = format_ticket_fixed(f"{buildNo}_tickets")
-            #styledDf._display_funcs[(i,df.columns.get_loc('Tickets Fixed'))]=lambdaFunc(f"{buildNo}_tickets")
-        def format_column(val):
-            # green color
-            if val=='GO' or val=='CONDITIONAL-GO':
-                return 'color: #20bd49'
-            # dark yellow color
-            elif val=='IN-PROGRESS':
-                return 'color: #fdb904'
-        styledDf=styledDf.applymap(format_column,subset=['Staging Verdict'])
+        for column,label in labels.items():
+            styledDf=LinkLabels.format_rows(styledDf,column,label)
+        def format_column(col):
+            # green color for GO/CONDITIONAL-GO, dark yellow color for IN-PROGRESS
+            return col.map({'GO':'color: #20bd49','CONDITIONAL-GO':'color: #20bd49','IN-PROGRESS':'color: #fdb904'}).fillna('')
+        styledDf=styledDf.apply(format_column,subset=['Staging Verdict'])
         return styledDf
 
 
 if __name__ == "__main__":
-    app = Dashboard()
-    app.main()
+    try:
+        app = Dashboard()
+        app.main()
+    finally:
+        # every rerun runs on a new script thread, the next one picks up this run's connection
+        Database.release()
@@ -1,60 +1,300 @@
 # Author      : Lenine Ajagappane <Lenine.Ajagappane@amd.com>
 # Description : sqlite3 database class.
 
+import atexit
+import contextlib
 import os
+import pandas as pd
+import re
 import sqlite3
+import threading
+import time
+from db_metrics import DBMetrics
+from query_builder import QueryBuilder
+from result_cache import ResultCache
 
 
-class Database(object):
+class ConnectionPool(object):
+    """Process-wide pool of sqlite3 connections, a thread checks one out on its first use and returns it with
+    release() or when it finishes, the next thread gets it back with its prepared statements"""
 
-    __DB_LOCATION = os.path.join(os.path.dirname(__file__), 'staging_data_db.sqlite')
+    # WAL lets dashboard readers run alongside the backfill scripts' writer,
+    # busy_timeout makes writers wait for the lock instead of failing at once.
+    __PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA temp_store=MEMORY",
+    )
+    # prepared statements kept per connection, keyed by SQL text (see QueryBuilder)
+    __CACHED_STATEMENTS = 256
+    # returned connections kept open for the next threads, the rest are closed
+    MAX_IDLE = 8
+    # how often a connection looks for an attached database file that did not exist yet, see create_archive()
+    ATTACH_CHECK_SECONDS = 5
 
-    def __init__(self):
-        """Initialize db class variables"""
-        if self.get_sqlite3_thread_safety() == 3:
-            check_same_thread = False
+    def __init__(self, db_location, check_same_thread=True, attached=None, owned=None):
+        self.__db_location = db_location
+        self.__check_same_thread = check_same_thread
+        # schema name -> database file, attached to each connection once the file exists
+        self.__attached = dict(attached or {})
+        # schema name -> database file, attached to each connection on open and created if missing, its writes are
+        # not part of data_version()
+        self.__owned = dict(owned or {})
+        self.__lock = threading.Lock()
+        # thread ident -> [thread, connection, cursor, attached schemas] of the checked out connections
+        self.__connections = {}
+        # [connection, cursor, attached schemas] of the returned connections
+        self.__free = []
+        # read-only connection polling PRAGMA data_version, see data_version()
+        self.__watcher = None
+        self.__watcher_lock = threading.Lock()
+
+    def __connect(self, check_same_thread=None):
+        check_same_thread = self.__check_same_thread if check_same_thread is None else check_same_thread
+        conn = sqlite3.connect(self.__db_location, check_same_thread=check_same_thread,
+                               cached_statements=self.__CACHED_STATEMENTS)
+        for pragma in self.__PRAGMAS:
+            conn.execute(pragma)
+        for schema, location in self.__owned.items():
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (location,))
+            conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        return conn
+
+    def __attach(self, conn, attached):
+        """attach the databases conn does not have yet and whose file exists now, returns the schemas conn has"""
+        for schema, location in self.__attached.items():
+            # ATTACH fails inside a transaction, the next call outside of it attaches
+            if schema not in attached and not conn.in_transaction and os.path.exists(location):
+                conn.execute(f"ATTACH DATABASE ? AS {schema}", (location,))
+                conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+                attached = attached | {schema}
+        return attached
+
+    def __attach_due(self, entry):
+        # an archive created after a connection was opened (archive_data.py) is attached by the connection's first use
+        # ATTACH_CHECK_SECONDS after its last look, entry[4] is the time of the next look
+        if len(entry[3]) < len(self.__attached) and time.monotonic() >= entry[4]:
+            entry[3] = self.__attach(entry[1], entry[3])
+            entry[4] = time.monotonic() + self.ATTACH_CHECK_SECONDS
+
+    def __entry(self):
+        thread = threading.current_thread()
+        entry = self.__connections.get(thread.ident)
+        # thread idents are recycled, so only use a connection checked out by this very thread
+        if entry is None or entry[0] is not thread:
+            with self.__lock:
+                self.__prune()
+                entry = [thread] + (self.__free.pop() if self.__free else [])
+                self.__connections[thread.ident] = entry
+            if len(entry) == 1:
+                conn = self.__connect()
+                entry += [conn, conn.cursor(), frozenset(), 0.0]
+        self.__attach_due(entry)
+        return entry
+
+    def __prune(self):
+        # take back the connections of finished threads (e.g. streamlit script runs that did not release())
+        for ident, entry in list(self.__connections.items()):
+            if not entry[0].is_alive():
+                del self.__connections[ident]
+                self.__give_back(entry, owner=False)
+
+    def __give_back(self, entry, owner):
+        conn = entry[1]
+        if self.__check_same_thread:
+            # without sqlite's serialized mode a connection stays with its thread, which alone can close it
+            if owner:
+                conn.close()
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        if len(self.__free) < self.MAX_IDLE:
+            self.__free.append(entry[1:])
         else:
-            check_same_thread = True
-        self.__connection = sqlite3.connect(Database.__DB_LOCATION, check_same_thread=check_same_thread)
-        self.__cur = self.__connection.cursor()
+            conn.close()
 
-    def get_sqlite3_thread_safety(self):
-        # Mape value from SQLite's THREADSAFE to Python's DBAPI 2.0
-        # threadsafety attribute.
-        sqlite_threadsafe2python_dbapi = {0: 0, 2: 1, 1: 3}
-        conn = sqlite3.connect(Database.__DB_LOCATION)
-        threadsafety = conn.execute(
-            """
-            select * from pragma_compile_options
-            where compile_options like 'THREADSAFE=%'
-            """
-        ).fetchone()[0]
-        conn.close()
-        threadsafety_value = int(threadsafety.split("=")[1])
-        return sqlite_threadsafe2python_dbapi[threadsafety_value]
-
-    def __del__(self):
-        self.__connection.commit()
-        self.__connection.close()
+    def release(self):
+        """return the calling thread's connection to the pool, its next use checks one out again"""
+        thread = threading.current_thread()
+        with self.__lock:
+            entry = self.__connections.get(thread.ident)
+            if entry is not None and entry[0] is thread:
+                del self.__connections[thread.ident]
+                self.__give_back(entry, owner=True)
 
-    def execute(self, new_data, values={}):
-        """execute a row of data to current cursor"""
-        try:
-            self.__cur.execute(new_data, values)
-            self.__connection.commit()
-            return 1
-        except Exception as e:
-            return 0
+    def get_connection(self):
+        return self.__entry()[1]
 
-    def executemany(self, many_new_data):
-        """add many new data to database in one go"""
-        self.create_table()
-        self.__cur.executemany('REPLACE INTO jobs VALUES(?, ?, ?, ?)', many_new_data)
-        self.__connection.commit()
+    def data_version(self):
+        """PRAGMA data_version of every attached database, as seen by a connection that never writes itself,
+        so a commit from any connection or process changes it"""
+        with self.__watcher_lock:
+            if self.__watcher is None:
+                conn = self.__connect(check_same_thread=False)
+                self.__watcher = [None, conn, None, frozenset(), 0.0]
+            # a newly attached schema changes the version length, which invalidates every cached result
+            self.__attach_due(self.__watcher)
+            conn, attached = self.__watcher[1], self.__watcher[3]
+            return tuple(conn.execute(f"PRAGMA {schema}.data_version").fetchone()[0] for schema in ('main',) + tuple(sorted(attached)))
 
-    def create_table(self):
-        """create a database table if it does not exist already"""
-        self.__cur.execute("""CREATE TABLE if not exists data_mgr (build_tag varchar(20) not null,
+    def get_cursor(self):
+        return self.__entry()[2]
+
+    def close_all(self):
+        with self.__watcher_lock:
+            if self.__watcher is not None:
+                self.__watcher[1].close()
+                self.__watcher = None
+        with self.__lock:
+            for ident, (_, conn, *_) in list(self.__connections.items()):
+                try:
+                    conn.commit()
+                    conn.close()
+                except sqlite3.ProgrammingError:
+                    # connection belongs to another thread and cannot be closed from here
+                    pass
+                del self.__connections[ident]
+            for conn, *_ in self.__free:
+                conn.close()
+            self.__free = []
+
+
+class WriteBatch(object):
+    """Writes queued by the backfill scripts, applied by Database.batch() in one transaction"""
+
+    def __init__(self):
+        self.inserted = []
+        self.deleted = []
+        # column -> [(build_tag, value), ...]
+        self.entries = {}
+
+    def insert_data(self, u):
+        self.inserted.append(u)
+        return "success"
+
+    def remove_data_by_component(self, tag):
+        self.deleted.append(tag)
+
+    def add_entry(self, tag, comp, data):
+        self.entries.setdefault(comp, []).append((tag, data))
+        return "success"
+
+    def __len__(self):
+        return len(self.inserted) + len(self.deleted) + sum(len(v) for v in self.entries.values())
+
+
+class KeysetPager(object):
+    """Lazy pages of a QueryBuilder query in (start_date desc, build_tag desc) order, each page
+    continues from the key of the previous page's last row instead of an offset"""
+
+    def __init__(self, db, query, page_size=50):
+        self.__db = db
+        self.__query = query
+        self.page_size = page_size
+        self.__key_pos = [query.columns.index(c) for c in QueryBuilder.KEYSET]
+
+    def key(self, row):
+        """the (start_date, build_tag) keyset position of a row"""
+        return tuple(row[i] for i in self.__key_pos)
+
+    def page_query(self, after=None, before=None):
+        """the query of the page after/before a key, it reads one row more than page_size"""
+        query = self.__query.copy()
+        if after is not None:
+            query.where_keyset(after)
+        if before is not None:
+            query.where_keyset(before, before=True)
+        # one extra row tells whether there is another page, without a count(*)
+        return query.order_by(*[(c, before is None) for c in QueryBuilder.KEYSET]).limit(self.page_size + 1)
+
+    def fetch_page(self, after=None, before=None):
+        """return (status, rows, has_more), has_more tells whether another page exists in the direction read"""
+        desc = before is None
+        res, rows = self.__db.select(self.page_query(after, before))
+        if res != "success":
+            return (res, [], False)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not desc:
+            rows.reverse()
+        return (res, rows, has_more)
+
+    def __iter__(self):
+        after = None
+        while True:
+            res, rows, has_more = self.fetch_page(after=after)
+            if res != "success":
+                raise NameError(f"DB failed to retrieve: {res}")
+            if rows:
+                yield rows
+            if not has_more:
+                return
+            after = self.key(rows[-1])
+
+
+class Database(object):
+
+    __DB_LOCATION = os.path.join(os.path.dirname(__file__), 'staging_data_db.sqlite')
+    __thread_safety = None
+    __pools = {}
+    __pools_lock = threading.Lock()
+    # per-thread transaction nesting depth, see transaction()
+    __local = threading.local()
+    # data_mgr columns in table order
+    __TABLE_COLUMNS = ('build_tag', 'comp_name', 'stg_type', 'build_url', 'request_date', 'start_date', 'code_date', 'end_date',
+                       'status', 'blocker_tick', 'is_promoted', 'promoted_main_build', 'details_report', 'remarks', 'commit_info',
+                       'ticket_fixed', 'base_commit', 'promo_details', 'promo_status', 'release_sub_comp', 'cp_patches', 'release_commit',
+                       'build_no')
+    # stored as plain URLs, see plain_url()
+    URL_COLUMNS = ('build_url', 'promoted_main_build', 'details_report')
+    __PLAIN_URLS_VERSION = 1
+    # columns filled in later by update_commit_details.py / update_ticket_fixed_details.py
+    __BACKFILL_COLUMNS = ('commit_info', 'ticket_fixed', 'base_commit', 'promo_details', 'promo_status', 'cp_patches', 'release_commit')
+    # indexes owned by create_indexes(), bump __INDEX_VERSION whenever this set changes
+    __INDEX_VERSION = 3
+    __INDEXES = {
+        # "builds after N" lookups on the build_no derived from build_url
+        'idx_data_mgr_comp_build_no': "CREATE INDEX idx_data_mgr_comp_build_no ON data_mgr (comp_name, build_no)",
+        # build_tag completes the (start_date, build_tag) keyset order used by KeysetPager
+        'idx_data_mgr_comp_start': "CREATE INDEX idx_data_mgr_comp_start ON data_mgr (comp_name, start_date, build_tag)",
+        'idx_data_mgr_comp_promoted_start': "CREATE INDEX idx_data_mgr_comp_promoted_start ON data_mgr (comp_name, is_promoted, start_date, build_tag)",
+    }
+    __INDEXES.update({
+        f'idx_data_mgr_empty_{column}': f"CREATE INDEX idx_data_mgr_empty_{column} ON data_mgr (comp_name, start_date) WHERE {column} = ''"
+        for column in __BACKFILL_COLUMNS
+    })
+    # substring-searchable columns mirrored into the data_mgr_fts trigram index, bump __FTS_VERSION when changed
+    FTS_COLUMNS = QueryBuilder.SEARCH_COLUMNS
+    __FTS_VERSION = 1
+    __fts_enabled = None
+    # flattened manifest columns parsed into build_commits at write time, column -> kind
+    MANIFEST_KINDS = {'commit_info': 'staging', 'base_commit': 'base', 'promo_details': 'promoted',
+                      'promo_status': 'status', 'release_commit': 'release'}
+    # version 2 keys the rows by manifest position instead of project
+    __BUILD_COMMITS_VERSION = 2
+    # column order of the get_build_commits rows
+    BUILD_COMMIT_COLUMNS = ('project', 'path', 'branch', 'commit_id', 'remote', 'staging_request', 'promoted')
+    # large columns the list views omit, read per build by the details panel
+    DETAIL_COLUMNS = tuple(MANIFEST_KINDS) + ('cp_patches',)
+    # read results shared by every session of this process, valid while the database version stays the same
+    __cache = ResultCache(512)
+    # bumped on every commit made through this class, on top of data_version which also sees other processes
+    __generation = 0
+    # latest promoted regular staging build per component, maintained by the last_promoted_* triggers
+    __LAST_PROMOTED_VERSION = 2
+    # version 2 moved the jobs table into its own database, see jobs_location()
+    __JOBS_VERSION = 2
+    __LAST_PROMOTED_INSERT = ("INSERT INTO last_promoted SELECT comp_name, build_tag, rtrim(build_url, '/'), build_no, start_date FROM data_mgr "
+                              "WHERE comp_name = {comp} AND is_promoted = 'Yes' AND instr(stg_type, 'Regular Staging') "
+                              "ORDER BY start_date DESC, build_tag DESC LIMIT 1")
+    # archive_data.py moves rows older than this into the archive database (see archive_rows)
+    ARCHIVE_AFTER_DAYS = 180
+
+    # shared by the hot and the archive database, see create_archive()
+    __DATA_MGR_DDL = """CREATE TABLE if not exists data_mgr (build_tag varchar(20) not null,
                             comp_name varchar(20) not null,
                             stg_type varchar(50) not null,
                             build_url varchar(255) not null,
@@ -76,141 +316,941 @@ class Database(object):
                             release_sub_comp varchar(256) not null,
                             cp_patches varchar(256) not null,
                             release_commit varchar(256) not null,
+                            build_no integer,
                         primary key(build_tag)
+                        );"""
+    # {schema} is '' or 'archive.', seq is the position in the manifest, which may list a project more than once
+    __BUILD_COMMITS_DDL = """CREATE TABLE if not exists {schema}build_commits (build_tag varchar(20) not null,
+                            kind varchar(20) not null,
+                            seq integer not null,
+                            project varchar(100) not null,
+                            path varchar(255),
+                            branch varchar(255),
+                            commit_id varchar(64),
+                            remote varchar(100),
+                            staging_request varchar(10),
+                            promoted varchar(10),
+                        primary key(build_tag, kind, seq)
+                        );"""
+
+    def __init__(self):
+        """Initialize db class variables"""
+        self.__pool = Database.get_pool(Database.__DB_LOCATION)
+
+    @classmethod
+    def get_pool(cls, db_location):
+        """return the process-wide connection pool for db_location, creating it on first use"""
+        with cls.__pools_lock:
+            if db_location not in cls.__pools:
+                check_same_thread = cls.get_sqlite3_thread_safety() != 3
+                cls.__pools[db_location] = ConnectionPool(db_location, check_same_thread, {'archive': cls.archive_location(db_location)},
+                                                          {'jobs': cls.jobs_location(db_location)})
+            return cls.__pools[db_location]
+
+    @classmethod
+    def archive_location(cls, db_location=None):
+        """the archive database living next to db_location (default the hot database)"""
+        return os.path.splitext(db_location or cls.__DB_LOCATION)[0] + '_archive.sqlite'
+
+    @classmethod
+    def jobs_location(cls, db_location=None):
+        """the JobQueue database living next to db_location (default the hot database), queue traffic stays out of
+        the data_version keying the result cache"""
+        return os.path.splitext(db_location or cls.__DB_LOCATION)[0] + '_jobs.sqlite'
+
+    @classmethod
+    def create_archive(cls):
+        """create the archive database, every connection attaches it as 'archive' within ConnectionPool.ATTACH_CHECK_SECONDS"""
+        created = not os.path.exists(cls.archive_location())
+        conn = sqlite3.connect(cls.archive_location())
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(cls.__DATA_MGR_DDL)
+            conn.execute(cls.__BUILD_COMMITS_DDL.format(schema=''))
+            conn.execute("CREATE INDEX if not exists idx_data_mgr_start ON data_mgr (start_date)")
+            conn.execute("CREATE INDEX if not exists idx_data_mgr_comp_start ON data_mgr (comp_name, start_date, build_tag)")
+            conn.commit()
+        finally:
+            conn.close()
+        if created:
+            # rows moved before the connections of running processes attached the new file would vanish from their reads
+            time.sleep(ConnectionPool.ATTACH_CHECK_SECONDS)
+
+    @classmethod
+    def close_all(cls):
+        with cls.__pools_lock:
+            for pool in cls.__pools.values():
+                pool.close_all()
+
+    @classmethod
+    def release(cls):
+        """return the calling thread's connections to their pools, e.g. at the end of a dashboard script run"""
+        with cls.__pools_lock:
+            pools = list(cls.__pools.values())
+        for pool in pools:
+            pool.release()
+
+    @classmethod
+    def get_sqlite3_thread_safety(cls):
+        # Mape value from SQLite's THREADSAFE to Python's DBAPI 2.0
+        # threadsafety attribute. Compile options never change at runtime, so probe once per process.
+        if cls.__thread_safety is None:
+            sqlite_threadsafe2python_dbapi = {0: 0, 2: 1, 1: 3}
+            conn = sqlite3.connect(':memory:')
+            threadsafety = conn.execute(
+                """
+                select * from pragma_compile_options
+                where compile_options like 'THREADSAFE=%'
+                """
+            ).fetchone()[0]
+            conn.close()
+            threadsafety_value = int(threadsafety.split("=")[1])
+            cls.__thread_safety = sqlite_threadsafe2python_dbapi[threadsafety_value]
+        return cls.__thread_safety
+
+    @property
+    def __connection(self):
+        return self.__pool.get_connection()
+
+    @property
+    def __cur(self):
+        return self.__pool.get_cursor()
+
+    def in_transaction(self):
+        return getattr(Database.__local, 'depth', 0) > 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """group several writes into one transaction, nested calls join the outermost one"""
+        depth = getattr(Database.__local, 'depth', 0)
+        Database.__local.depth = depth + 1
+        try:
+            if depth == 0:
+                changes = self.__connection.total_changes
+                if not self.__connection.in_transaction:
+                    # take the write lock up front, upgrading a read lock later can fail immediately under WAL
+                    self.__connection.execute("BEGIN IMMEDIATE")
+            yield self
+            if depth == 0:
+                self.__connection.commit()
+                # a transaction that wrote nothing leaves the cached results valid
+                if self.__connection.total_changes != changes:
+                    Database.__committed()
+        except BaseException:
+            if depth == 0:
+                self.__connection.rollback()
+            raise
+        finally:
+            Database.__local.depth = depth
+
+    @classmethod
+    def __committed(cls):
+        cls.__generation += 1
+        cls.__cache.clear()
+
+    @classmethod
+    def cache_stats(cls):
+        """(entries, hits, misses) of the result cache"""
+        return len(cls.__cache), cls.__cache.hits, cls.__cache.misses
+
+    def __cached(self, key, read):
+        # uncommitted writes of an open transaction must not leak into the shared cache
+        if self.in_transaction():
+            return read()
+        # the version is taken before reading, a commit racing the read leaves the entry under the old version
+        version = (Database.__generation,) + self.__pool.data_version()
+        hit, value = Database.__cache.get(key, version)
+        if hit:
+            return value
+        value = read()
+        if not isinstance(value, tuple) or value[0] == "success":
+            Database.__cache.put(key, version, value)
+        return value
+
+    @contextlib.contextmanager
+    def batch(self):
+        """queue add_entry/insert_data/remove_data_by_component calls and apply them in one transaction on exit"""
+        batch = WriteBatch()
+        try:
+            yield batch
+        except BaseException:
+            # writes queued before a failure are still valid, keep them as the per-row commits did,
+            # the failure itself is what the caller gets
+            if len(batch):
+                self.write_batch(batch)
+            raise
+        if len(batch) and self.write_batch(batch) != "success":
+            raise NameError("DB batch commit failed")
+
+    def execute(self, new_data, values={}):
+        """execute a row of data to current cursor"""
+        try:
+            self.__cur.execute(new_data, values)
+            if not self.in_transaction():
+                self.__connection.commit()
+            return 1
+        except Exception as e:
+            return 0
+
+    @staticmethod
+    def plain_url(value):
+        """the href of an <a href="url">..</a> anchor as written by older versions, anything else unchanged"""
+        if isinstance(value, str) and value.startswith('<a '):
+            match = re.search(r'href=[\'"]?([^\'" >]*)', value)
+            return match.group(1) if match else ''
+        return value
+
+    @staticmethod
+    def build_no(build_url):
+        """trailing build number of a build URL, None if it has none"""
+        match = re.search(r'(\d+)/?$', build_url or '')
+        return int(match.group(1)) if match else None
+
+    @DBMetrics.timed
+    def executemany(self, many_new_data):
+        """add or replace many rows (sequences in data_mgr column order, build_no excluded) in one go"""
+        columns = ', '.join(Database.__TABLE_COLUMNS)
+        placeholders = ', '.join('?' * len(Database.__TABLE_COLUMNS))
+        # upsert instead of REPLACE so the rowid (and anything keyed on it) survives
+        updates = ', '.join(f"{c}=excluded.{c}" for c in Database.__TABLE_COLUMNS[1:])
+        try:
+            with self.transaction():
+                many_new_data = [self.__row_values(row) for row in many_new_data]
+                self.__delete_many([row[0] for row in many_new_data], self.__schemas()[1:])
+                self.__cur.executemany(f"INSERT INTO data_mgr ({columns}) VALUES ({placeholders}) "
+                                       f"ON CONFLICT(build_tag) DO UPDATE SET {updates}", many_new_data)
+                self.__sync_build_commits([(row[0], column, row[Database.__TABLE_COLUMNS.index(column)])
+                                           for row in many_new_data for column in Database.MANIFEST_KINDS])
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    def __row_values(self, row):
+        # plain URLs plus the build_no derived from build_url, in __TABLE_COLUMNS order
+        row = [Database.plain_url(v) if c in Database.URL_COLUMNS else v for c, v in zip(Database.__TABLE_COLUMNS[:-1], row)]
+        return row + [Database.build_no(row[Database.__TABLE_COLUMNS.index('build_url')])]
+
+    @DBMetrics.timed
+    def create_table(self):
+        """create a database table if it does not exist already"""
+        self.__cur.execute(Database.__DATA_MGR_DDL)
+
+        self.__cur.execute("""CREATE TABLE if not exists schema_meta (name varchar(50) not null,
+                            version integer not null,
+                        primary key(name)
                         );""")
+        self.__cur.execute(Database.__BUILD_COMMITS_DDL.format(schema=''))
+
         self.__connection.commit()
+        self.migrate_plain_urls()
+        self.create_indexes()
+        self.create_fts()
+        self.migrate_build_commits()
+        self.create_last_promoted()
+        self.create_jobs()
 
-    def update_db(self, deleted, modified):
-        if len(deleted) > 0:
-            res=1
-            for ele in deleted:
-                with self.__connection:
-                    res=res*self.execute("DELETE from data_mgr WHERE build_tag = :tag", {'tag':ele})
-            if res:
-                return "success"
-            return "failed"
-        if len(modified) > 0:
-            res=1
-            for ele in modified:
-                args = dict(ele)
-                del ele['build_tag']
-                set_lines= ",".join([f"{k}=:{k}" for k in ele.keys()])
-                statement = f"UPDATE data_mgr SET {set_lines} WHERE build_tag = :build_tag"
-                with self.__connection:
-                    res=res*self.execute(statement, args)
-            if res:
-                return "success"
-            return "failed"
+    def get_schema_version(self, name):
+        """return the applied version of a schema object group, 0 if never applied"""
+        self.__cur.execute("select version from schema_meta where name = :name", {'name': name})
+        row = self.__cur.fetchone()
+        return row[0] if row else 0
 
-    def insert_data(self, u):
-        res = 1
-        with self.__connection:
-            u.release_sub_comp=",".join(str(i) for i in u.release_sub_comp)
-            res = res * self.execute("insert into data_mgr values (:tag, :comp, :stype, :url, :rdate, :sdate, :cdate, :edate, :status, :blocker, :ispromo, :mainUrl, :report, :remarks, :commit, :gtick, :basecommit, :pdetail, :pstatus, :rscomponent, :cppatch, :relcommit)",
-                            {'tag': u.build_tag, 'comp': u.comp_name, 'stype': u.stg_type, 'url': u.build_url, 'rdate': u.request_date, 'sdate': u.start_date, 'cdate': u.code_date,
-                             'edate': u.end_date, 'status': u.status, 'blocker': u.blocker_tick, 'ispromo': u.is_promoted, 'mainUrl': u.promoted_main_build, 'report': u.details_report,
-                             'remarks': u.remarks, 'commit': u.commit_info, 'gtick': u.ticket_fixed, 'basecommit': u.base_commit, 'pdetail': u.promo_details, 'pstatus': u.promo_status,
-                             'rscomponent': u.release_sub_comp, 'cppatch': u.cp_patches, 'relcommit': u.release_commit})
-        if res:
+    def __set_schema_version(self, name, version):
+        self.__cur.execute("insert or replace into schema_meta values (:name, :version)", {'name': name, 'version': version})
+
+    def create_indexes(self):
+        """bring the managed data_mgr indexes in line with __INDEXES if their version changed"""
+        if self.get_schema_version('indexes') >= Database.__INDEX_VERSION:
+            return
+        with self.transaction():
+            self.__cur.execute("select name, sql from sqlite_master where type = 'index' and tbl_name = 'data_mgr' and name like 'idx_data_mgr_%'")
+            existing = dict(self.__cur.fetchall())
+            for name, sql in existing.items():
+                if Database.__INDEXES.get(name) != sql:
+                    self.__cur.execute(f"DROP INDEX {name}")
+            for name, sql in Database.__INDEXES.items():
+                if existing.get(name) != sql:
+                    self.__cur.execute(sql)
+            self.__cur.execute("ANALYZE data_mgr")
+            self.__set_schema_version('indexes', Database.__INDEX_VERSION)
+
+    def create_fts(self):
+        """create the trigram full-text index over FTS_COLUMNS, kept in sync with data_mgr by triggers"""
+        if self.get_schema_version('fts') >= Database.__FTS_VERSION:
+            Database.__fts_enabled = True
+            return
+        # the trigram tokenizer needs sqlite 3.34, older builds keep using plain like scans
+        if sqlite3.sqlite_version_info < (3, 34, 0):
+            Database.__fts_enabled = False
+            return
+        columns = ', '.join(Database.FTS_COLUMNS)
+        new_values = ', '.join(f"new.{c}" for c in Database.FTS_COLUMNS)
+        old_values = ', '.join(f"old.{c}" for c in Database.FTS_COLUMNS)
+        try:
+            with self.transaction():
+                for trigger in ('data_mgr_fts_ai', 'data_mgr_fts_ad', 'data_mgr_fts_au'):
+                    self.__cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                self.__cur.execute("DROP TABLE IF EXISTS data_mgr_fts")
+                self.__cur.execute(f"CREATE VIRTUAL TABLE data_mgr_fts USING fts5({columns}, content='data_mgr', content_rowid='rowid', tokenize='trigram')")
+                self.__cur.execute(f"""CREATE TRIGGER data_mgr_fts_ai AFTER INSERT ON data_mgr BEGIN
+                                        INSERT INTO data_mgr_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+                                    END""")
+                self.__cur.execute(f"""CREATE TRIGGER data_mgr_fts_ad AFTER DELETE ON data_mgr BEGIN
+                                        INSERT INTO data_mgr_fts(data_mgr_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                                    END""")
+                self.__cur.execute(f"""CREATE TRIGGER data_mgr_fts_au AFTER UPDATE OF {columns} ON data_mgr BEGIN
+                                        INSERT INTO data_mgr_fts(data_mgr_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                                        INSERT INTO data_mgr_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+                                    END""")
+                self.__cur.execute("INSERT INTO data_mgr_fts(data_mgr_fts) VALUES ('rebuild')")
+                self.__set_schema_version('fts', Database.__FTS_VERSION)
+            Database.__fts_enabled = True
+        except sqlite3.OperationalError:
+            # sqlite built without fts5
+            Database.__fts_enabled = False
+
+    def migrate_build_commits(self):
+        """(re)create build_commits and parse the manifest columns of every row into it"""
+        if self.get_schema_version('build_commits') >= Database.__BUILD_COMMITS_VERSION:
+            return
+        columns = list(Database.MANIFEST_KINDS)
+        with self.transaction():
+            schemas = self.__schemas()
+            for schema in schemas:
+                self.__cur.execute(f"DROP TABLE IF EXISTS {schema}.build_commits")
+                self.__cur.execute(Database.__BUILD_COMMITS_DDL.format(schema=f'{schema}.'))
+            for schema in schemas:
+                reader = self.__connection.cursor()
+                reader.execute(f"select build_tag, {', '.join(columns)} from {schema}.data_mgr")
+                while True:
+                    rows = reader.fetchmany(500)
+                    if not rows:
+                        break
+                    self.__sync_build_commits([(row[0], column, value) for row in rows for column, value in zip(columns, row[1:])])
+            self.__set_schema_version('build_commits', Database.__BUILD_COMMITS_VERSION)
+
+    def migrate_plain_urls(self):
+        """rewrite the <a href> anchors of URL_COLUMNS as plain URLs and fill build_no for rows written before it existed"""
+        if self.get_schema_version('plain_urls') >= Database.__PLAIN_URLS_VERSION:
+            return
+        columns = ('build_tag',) + Database.URL_COLUMNS
+        with self.transaction():
+            self.__cur.execute("select name from pragma_table_info('data_mgr')")
+            if 'build_no' not in [row[0] for row in self.__cur.fetchall()]:
+                self.__cur.execute("ALTER TABLE data_mgr ADD COLUMN build_no integer")
+            reader = self.__connection.cursor()
+            reader.execute(f"select {', '.join(columns)} from data_mgr")
+            set_lines = ", ".join(f"{c} = ?" for c in Database.URL_COLUMNS)
+            while True:
+                rows = reader.fetchmany(500)
+                if not rows:
+                    break
+                urls = [[Database.plain_url(v) for v in row[1:]] for row in rows]
+                self.__cur.executemany(f"UPDATE data_mgr SET {set_lines}, build_no = ? WHERE build_tag = ?",
+                                       [url + [Database.build_no(url[0]), row[0]] for row, url in zip(rows, urls)])
+            self.__set_schema_version('plain_urls', Database.__PLAIN_URLS_VERSION)
+
+    def create_last_promoted(self):
+        """(re)create the triggers keeping last_promoted current and fill it from data_mgr"""
+        if self.get_schema_version('last_promoted') >= Database.__LAST_PROMOTED_VERSION:
+            return
+        insert = lambda comp: Database.__LAST_PROMOTED_INSERT.format(comp=comp)
+        refresh = lambda comp: f"DELETE FROM last_promoted WHERE comp_name = {comp}; {insert(comp)};"
+        # only the columns deciding which build is the latest promoted one, backfills do not fire it
+        watched = 'comp_name, build_tag, stg_type, build_url, build_no, start_date, is_promoted'
+        with self.transaction():
+            for trigger in ('last_promoted_ai', 'last_promoted_ad', 'last_promoted_au'):
+                self.__cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            self.__cur.execute("DROP TABLE IF EXISTS last_promoted")
+            self.__cur.execute("""CREATE TABLE last_promoted (comp_name varchar(20) not null,
+                                build_tag varchar(20) not null,
+                                build_url varchar(255) not null,
+                                build_no integer,
+                                start_date varchar(50) not null,
+                            primary key(comp_name)
+                            );""")
+            self.__cur.execute(f"CREATE TRIGGER last_promoted_ai AFTER INSERT ON data_mgr BEGIN {refresh('new.comp_name')} END")
+            self.__cur.execute(f"CREATE TRIGGER last_promoted_ad AFTER DELETE ON data_mgr BEGIN {refresh('old.comp_name')} END")
+            self.__cur.execute(f"CREATE TRIGGER last_promoted_au AFTER UPDATE OF {watched} ON data_mgr BEGIN "
+                               f"{refresh('old.comp_name')} {refresh('new.comp_name')} END")
+            self.__cur.execute("select distinct comp_name from data_mgr")
+            self.__cur.executemany(insert('?'), self.__cur.fetchall())
+            self.__set_schema_version('last_promoted', Database.__LAST_PROMOTED_VERSION)
+
+    def create_jobs(self):
+        """create the jobs table behind JobQueue in the attached jobs database, one row per (kind, job_key) holding
+        its latest input hash and outcome"""
+        self.__cur.execute("""CREATE TABLE if not exists jobs.jobs (kind varchar(50) not null,
+                            job_key varchar(255) not null,
+                            status varchar(20) not null,
+                            input_hash varchar(64),
+                            done_hash varchar(64),
+                            attempts integer not null default 0,
+                            error text,
+                            enqueued_at timestamp,
+                            started_at timestamp,
+                            finished_at timestamp,
+                            lock_key varchar(255),
+                        primary key(kind, job_key)
+                        );""")
+        self.__cur.execute("CREATE INDEX if not exists jobs.idx_jobs_status ON jobs (status, enqueued_at)")
+        self.__cur.execute("select name from pragma_table_info('jobs', 'jobs')")
+        if 'lock_key' not in [row[0] for row in self.__cur.fetchall()]:
+            self.__cur.execute("ALTER TABLE jobs.jobs ADD COLUMN lock_key varchar(255)")
+        self.__connection.commit()
+        if self.get_schema_version('jobs') >= Database.__JOBS_VERSION:
+            return
+        # version 1 kept the jobs in the hot database
+        with self.transaction():
+            self.__cur.execute("select 1 from main.sqlite_master where type = 'table' and name = 'jobs'")
+            if self.__cur.fetchone() is not None:
+                columns = 'kind, job_key, status, input_hash, done_hash, attempts, error, enqueued_at, started_at, finished_at'
+                self.__cur.execute(f"INSERT OR IGNORE INTO jobs.jobs ({columns}) SELECT {columns} FROM main.jobs")
+                self.__cur.execute("DROP TABLE main.jobs")
+            self.__set_schema_version('jobs', Database.__JOBS_VERSION)
+
+    def __write_jobs(self, sql, params, many=False):
+        # one autocommit statement, it only locks the jobs database and never clears the result cache
+        if many:
+            self.__cur.executemany(sql, params)
+        else:
+            self.__cur.execute(sql, params)
+        rows = self.__cur.rowcount
+        self.__connection.commit()
+        return rows
+
+    @DBMetrics.timed
+    def enqueue_jobs(self, kind, jobs):
+        """queue [(job_key, input_hash, lock_key)] of kind, keys already done or pending for the same input hash are left alone,
+        jobs with the same lock_key are not run side by side, returns (status, number of jobs queued)"""
+        if not jobs:
+            return ("success", 0)
+        try:
+            # a running job keeps running, finish_job requeues it when its input hash changed meanwhile,
+            # a new input hash starts over with no attempts
+            queued = self.__write_jobs("INSERT INTO jobs.jobs (kind, job_key, status, input_hash, enqueued_at, lock_key) "
+                                       "VALUES (?, ?, 'queued', ?, datetime('now'), ?) ON CONFLICT (kind, job_key) DO UPDATE SET "
+                                       "status = case when jobs.status = 'running' then 'running' else 'queued' end, "
+                                       "attempts = case when jobs.input_hash is excluded.input_hash then jobs.attempts else 0 end, "
+                                       "input_hash = excluded.input_hash, enqueued_at = excluded.enqueued_at, lock_key = excluded.lock_key "
+                                       "WHERE excluded.input_hash is not jobs.done_hash "
+                                       "and not (jobs.status in ('queued', 'running') and jobs.input_hash is excluded.input_hash)",
+                                       [(kind, key, input_hash, lock_key) for key, input_hash, lock_key in jobs], many=True)
+            return ("success", queued)
+        except Exception as e:
+            return (f"failed error:{e}", 0)
+
+    def claim_job(self, kinds, busy=()):
+        """mark the oldest queued job of kinds whose lock_key is not in busy running,
+        returns (status, (kind, job_key, input_hash, lock_key) or None)"""
+        try:
+            while True:
+                # an idle poll only reads, the claim is a conditional update another worker may win
+                free = f"AND (lock_key is null OR lock_key NOT IN ({', '.join('?' * len(busy))})) " if busy else ""
+                self.__cur.execute("SELECT rowid, kind, job_key, input_hash, lock_key FROM jobs.jobs WHERE status = 'queued' "
+                                   f"AND kind IN ({', '.join('?' * len(kinds))}) {free}ORDER BY enqueued_at LIMIT 1",
+                                   tuple(kinds) + tuple(busy))
+                row = self.__cur.fetchone()
+                if row is None:
+                    return ("success", None)
+                if self.__write_jobs("UPDATE jobs.jobs SET status = 'running', attempts = attempts + 1, started_at = datetime('now') "
+                                     "WHERE rowid = ? AND status = 'queued' AND input_hash is ?", (row[0], row[3])):
+                    return ("success", tuple(row[1:]))
+        except Exception as e:
+            return (f"failed error:{e}", None)
+
+    def finish_job(self, kind, job_key, input_hash, error=None):
+        """record the outcome of a claimed job, it goes back to the queue if its input hash changed while it ran"""
+        try:
+            if error is None:
+                self.__write_jobs("UPDATE jobs.jobs SET status = case when input_hash is ? then 'done' else 'queued' end, "
+                                  "done_hash = ?, error = null, finished_at = datetime('now') WHERE kind = ? AND job_key = ?",
+                                  (input_hash, input_hash, kind, job_key))
+            else:
+                self.__write_jobs("UPDATE jobs.jobs SET status = case when input_hash is ? then 'failed' else 'queued' end, "
+                                  "error = ?, finished_at = datetime('now') WHERE kind = ? AND job_key = ?",
+                                  (input_hash, error, kind, job_key))
             return "success"
-        return "failed"
-
-    def get_data_by_element(self, element, data, from_date=-1, to_date=-1):
-        try:
-            with self.__connection:
-                if from_date != -1:
-                    if(self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where ({element} = :data) and (:from_date <= start_date) and (start_date <= :to_date) order by start_date desc;",
-                                    {'data': data, 'from_date':from_date, 'to_date':to_date})):
-                        return ("success",self.__cur.fetchall())
-                else:
-                    if(self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where {element} = :data order by start_date desc limit 10;",
-                                    {'data': data})):
-                        return ("success",self.__cur.fetchall())
-                return ("failed",())
         except Exception as e:
-            return (f"failed error:{e}",())
+            return f"failed error:{e}"
+
+    def retry_jobs(self, kind, max_attempts):
+        """queue again the failed jobs of kind tried fewer than max_attempts times, returns (status, number queued)"""
+        try:
+            return ("success", self.__write_jobs("UPDATE jobs.jobs SET status = 'queued', enqueued_at = datetime('now') "
+                                                 "WHERE kind = ? AND status = 'failed' AND attempts < ?", (kind, max_attempts)))
+        except Exception as e:
+            return (f"failed error:{e}", 0)
+
+    def recover_jobs(self):
+        """queue again the jobs left running by a process that stopped"""
+        try:
+            self.__write_jobs("UPDATE jobs.jobs SET status = 'queued' WHERE status = 'running'", ())
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    @DBMetrics.timed
+    def get_jobs(self, kind):
+        """(job_key, status, attempts, error, finished_at) of every job of kind, returns (status, rows), read
+        uncached since the jobs database is not part of the cache version"""
+        try:
+            self.__cur.execute("select job_key, status, attempts, error, finished_at from jobs.jobs where kind = ? order by enqueued_at desc",
+                               (kind,))
+            return ("success", self.__cur.fetchall())
+        except Exception as e:
+            return (f"failed error:{e}", [])
+
+    @DBMetrics.timed
+    def get_last_promoted(self, comp):
+        """(build_tag, build_url, build_no) of the latest promoted regular staging build of comp, None if there is none"""
+        return self.__cached(('get_last_promoted', comp), lambda: self.__get_last_promoted(comp))
+
+    def __get_last_promoted(self, comp):
+        try:
+            self.__cur.execute("select build_tag, build_url, build_no from last_promoted where comp_name = ?", (comp,))
+            return ("success", self.__cur.fetchone())
+        except Exception as e:
+            return (f"failed error:{e}", None)
+
+    @DBMetrics.timed
+    def last_promoted_builds(self):
+        """get_last_promoted for every component at once, returns (status, {comp_name: (build_tag, build_url, build_no)})"""
+        return self.__cached(('last_promoted_builds',), self.__last_promoted_builds)
+
+    def __last_promoted_builds(self):
+        try:
+            self.__cur.execute("select comp_name, build_tag, build_url, build_no from last_promoted")
+            return ("success", {row[0]: tuple(row[1:]) for row in self.__cur.fetchall()})
+        except Exception as e:
+            return (f"failed error:{e}", {})
+
+    @staticmethod
+    def parse_manifest(kind, manifest_str):
+        """split a flattened 'name,project,path,branch,commit,remote,...' string into build_commits rows"""
+        if not manifest_str or manifest_str == 'None':
+            return []
+        rows = []
+        # same splitting as JobUtils.format_manifest_data
+        for seq, chunk in enumerate(str(manifest_str).split('name')[1:]):
+            ele = [x for x in chunk.split(',') if x]
+            if not ele:
+                continue
+            ele += [None] * (6 - len(ele))
+            if kind == 'status':
+                # [Component, StagingCommit, StagingBranch, StagingRemoteName, StagingRequest?, Promoted?]
+                rows.append((seq, ele[0], None, ele[2], ele[1], ele[3], ele[4], ele[5]))
+            else:
+                # [ProjectName, ProjectPath, BranchName, CommitId, RemoteName]
+                rows.append((seq, ele[0], ele[1], ele[2], ele[3], ele[4], None, None))
+        return rows
+
+    def __sync_build_commits(self, entries):
+        # entries: [(build_tag, column, value)], columns outside MANIFEST_KINDS are ignored
+        entries = [(tag, Database.MANIFEST_KINDS[column], value) for tag, column, value in entries if column in Database.MANIFEST_KINDS]
+        if not entries:
+            return
+        schemas = self.__schemas()
+        for schema in schemas:
+            self.__cur.executemany(f"DELETE FROM {schema}.build_commits WHERE build_tag = ? AND kind = ?", [(tag, kind) for tag, kind, _ in entries])
+        # the rows live in the schema holding the build's data_mgr row, edits of archived builds stay in the archive
+        archived = set()
+        if 'archive' in schemas:
+            tags = list({tag for tag, _, _ in entries})
+            self.__cur.execute(f"select build_tag from archive.data_mgr where build_tag in ({', '.join('?' * len(tags))})", tags)
+            archived = {row[0] for row in self.__cur.fetchall()}
+        for schema in schemas:
+            self.__cur.executemany(f"INSERT INTO {schema}.build_commits VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(tag, kind) + row for tag, kind, value in entries if (tag in archived) == (schema == 'archive')
+                                    for row in Database.parse_manifest(kind, value)])
+
+    def __build_commits(self):
+        # rows of archived builds live in archive.build_commits
+        if len(self.__schemas()) == 1:
+            return "build_commits"
+        return "(select * from main.build_commits union all select * from archive.build_commits)"
 
-    def get_data_by_two_elements(self, data, from_date=-1, to_date=-1):
+    @DBMetrics.timed
+    def get_build_commits(self, build_tag, kind):
+        """typed manifest rows (project, path, branch, commit_id, remote, staging_request, promoted) of one build"""
+        return self.__cached(('get_build_commits', build_tag, kind), lambda: self.__get_build_commits(build_tag, kind))
+
+    def __get_build_commits(self, build_tag, kind):
         try:
-            d_list = list(data.items())
-            with self.__connection:
-                if from_date != -1:
-                    if(self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where ({d_list[0][0]}=:el1) and ({d_list[1][0]}=:el2) and (:from_date <= start_date) and (start_date <= :to_date) order by start_date desc;",
-                                    {'el1': d_list[0][1], 'el2': d_list[1][1], 'from_date': from_date, 'to_date': to_date})):
-                        return ("success", self.__cur.fetchall())
-                else:
-                    if(self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where {d_list[0][0]}=:el1 and {d_list[1][0]}=:el2 order by start_date desc limit 10;",
-                                    {'el1': d_list[0][1], 'el2': d_list[1][1]})):
-                        return ("success", self.__cur.fetchall())
-            return ("failed",())
+            self.__cur.execute("select project, path, branch, commit_id, remote, staging_request, promoted "
+                               f"from {self.__build_commits()} where build_tag = ? and kind = ? order by seq", (build_tag, kind))
+            return ("success", self.__cur.fetchall())
         except Exception as e:
             return (f"failed error:{e}",())
 
-    def get_data_by_three_elements(self, data, from_date=-1, to_date=-1):
+    @DBMetrics.timed
+    def build_commits_df(self, build_tag, kind, columns, headers):
+        """get_build_commits as a DataFrame of columns (from BUILD_COMMIT_COLUMNS) titled headers, returns (status, df),
+        the frame is shared by every caller and must not be modified"""
+        return self.__cached(('build_commits_df', build_tag, kind, tuple(columns), tuple(headers)),
+                             lambda: self.__build_commits_df(build_tag, kind, columns, headers))
+
+    def __build_commits_df(self, build_tag, kind, columns, headers):
+        res, rows = self.__get_build_commits(build_tag, kind)
+        if res != "success":
+            return (res, None)
+        try:
+            df = self.to_frame(rows, Database.BUILD_COMMIT_COLUMNS)[list(columns)]
+            df.columns = list(headers)
+            return ("success", df)
+        except Exception as e:
+            return (f"failed error:{e}", None)
+
+    @DBMetrics.timed
+    def get_build_detail(self, build_tag, column):
+        """value of one column of one build, for the DETAIL_COLUMNS the list views omit, returns (status, value)"""
         try:
-            d_list = list(data.items())
-            with self.__connection:
-                if from_date != -1:
-                    if(self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where ({d_list[0][0]}=:el1) and ({d_list[1][0]}=:el2) and ({d_list[2][0]}=:el3) and (:from_date <= start_date) and (start_date <= :to_date) order by start_date desc;",
-                                    {'el1': d_list[0][1], 'el2': d_list[1][1], 'el3': d_list[2][1], 'from_date': from_date, 'to_date': to_date})):
-                        return ("success", self.__cur.fetchall())
-                else:
-                    if(self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where {d_list[0][0]}=:el1 and {d_list[1][0]}=:el2 and {d_list[2][0]}=:el3 order by start_date desc limit 10;",
-                                    {'el1': d_list[0][1], 'el2': d_list[1][1], 'el3': d_list[2][1]})):
-                        return ("success", self.__cur.fetchall())
-            return ("failed",())
+            query = QueryBuilder().select(column).where_eq('build_tag', build_tag)
+        except Exception as e:
+            return (f"failed error:{e}", None)
+        res, rows = self.select(query)
+        return (res, rows[0][0] if rows else None)
+
+    @DBMetrics.timed
+    def compare_commits(self, build_tag, kind, *other_kinds, other_tag=None):
+        """join the kind manifest of build_tag with each of the other_kinds manifests of other_tag (default the same build)
+        on project, rows are (project, path, branch, commit_id, remote, other_commit_id per other kind) in manifest order,
+        projects missing from another manifest are left out"""
+        return self.__cached(('compare_commits', build_tag, kind, other_kinds, other_tag),
+                             lambda: self.__compare_commits(build_tag, kind, other_kinds, other_tag))
+
+    def __compare_commits(self, build_tag, kind, other_kinds, other_tag=None):
+        # a project listed twice in another manifest matches its first entry (the bare column of min(seq))
+        joins = "".join(f" join (select project, commit_id, min(seq) from {self.__build_commits()} where build_tag = ? and kind = ? "
+                        f"group by project) b{i} on b{i}.project = a.project" for i in range(len(other_kinds)))
+        try:
+            self.__cur.execute("select a.project, a.path, a.branch, a.commit_id, a.remote"
+                               + "".join(f", b{i}.commit_id" for i in range(len(other_kinds)))
+                               + f" from {self.__build_commits()} a{joins} where a.build_tag = ? and a.kind = ? order by a.seq",
+                               tuple(v for other_kind in other_kinds for v in (other_tag or build_tag, other_kind)) + (build_tag, kind))
+            return ("success", self.__cur.fetchall())
         except Exception as e:
             return (f"failed error:{e}",())
-        
-    def get_data_by_component_limit(self, comp, entries=10):
+
+    def fts_enabled(self):
+        if Database.__fts_enabled is None:
+            Database.__fts_enabled = self.get_schema_version('fts') > 0
+        return Database.__fts_enabled
+
+    def archive_attached(self):
+        self.__cur.execute("select 1 from pragma_database_list where name = 'archive'")
+        return self.__cur.fetchone() is not None
+
+    def __schemas(self):
+        return ('main', 'archive') if self.archive_attached() else ('main',)
+
+    def archive_horizon(self):
+        """newest start_date in the archive, None if there is no archive or it is empty"""
+        if not self.archive_attached():
+            return None
+        self.__cur.execute("select max(start_date) from archive.data_mgr")
+        return self.__cur.fetchone()[0]
+
+    @DBMetrics.timed
+    def archive_rows(self, before_date, batch_size=500):
+        """move rows that started before before_date into the archive, batch_size rows per transaction so
+        readers are never blocked for long and an interrupted run just continues, returns (status, moved)"""
+        if not self.archive_attached():
+            return ("failed error:archive database is not attached", 0)
+        columns = ', '.join(Database.__TABLE_COLUMNS)
+        moved = 0
         try:
-            with self.__connection:
-                if (self.execute(f"select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr where comp_name = :comp order by start_date desc limit {entries};", {'comp': comp})):
-                    return ("success",self.__cur.fetchall())
+            while True:
+                with self.transaction():
+                    # the builds last_promoted points at stay hot, they are read on every summary render
+                    self.__cur.execute("select build_tag from main.data_mgr where start_date < ? "
+                                       "and build_tag not in (select build_tag from last_promoted) "
+                                       "order by start_date limit ?", (str(before_date), batch_size))
+                    tags = self.__cur.fetchall()
+                    if not tags:
+                        break
+                    self.__cur.executemany(f"INSERT OR REPLACE INTO archive.data_mgr ({columns}) "
+                                           f"select {columns} from main.data_mgr where build_tag = ?", tags)
+                    self.__cur.executemany("DELETE FROM archive.build_commits where build_tag = ?", tags)
+                    self.__cur.executemany("INSERT INTO archive.build_commits select * from main.build_commits where build_tag = ?", tags)
+                    self.__delete_many([tag for (tag,) in tags], ('main',))
+                moved += len(tags)
+            return ("success", moved)
+        except Exception as e:
+            return (f"failed error:{e}", moved)
+
+    def vacuum(self):
+        """give the pages freed by archive_rows back to the filesystem"""
+        self.__cur.execute("VACUUM main")
+        if self.fts_enabled():
+            # VACUUM may renumber the rowids of data_mgr, which the external content index points at
+            with self.transaction():
+                self.__cur.execute("INSERT INTO data_mgr_fts(data_mgr_fts) VALUES ('rebuild')")
+
+    @DBMetrics.timed
+    def update_db(self, deleted, modified):
+        """apply the deleted build tags and modified rows from the admin editor in one transaction"""
+        try:
+            with self.transaction():
+                self.__delete_many(deleted)
+                self.__update_many(modified)
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    def __delete_many(self, tags, schemas=None):
+        for schema in self.__schemas() if schemas is None else schemas:
+            self.__cur.executemany(f"DELETE from {schema}.data_mgr WHERE build_tag = ?", [(tag,) for tag in tags])
+            self.__cur.executemany(f"DELETE from {schema}.build_commits WHERE build_tag = ?", [(tag,) for tag in tags])
+
+    def __update_many(self, modified):
+        # rows changing the same set of columns share one statement, so group them for executemany
+        groups = {}
+        for ele in modified:
+            ele = {k: Database.plain_url(v) if k in Database.URL_COLUMNS else v for k, v in ele.items()}
+            if 'build_url' in ele:
+                ele['build_no'] = Database.build_no(ele['build_url'])
+            columns = tuple(k for k in ele.keys() if k != 'build_tag')
+            self.__check_columns(columns)
+            groups.setdefault(columns, []).append(ele)
+        for columns, rows in groups.items():
+            set_lines = ",".join([f"{k}=:{k}" for k in columns])
+            for schema in self.__schemas():
+                self.__cur.executemany(f"UPDATE {schema}.data_mgr SET {set_lines} WHERE build_tag = :build_tag", rows)
+        self.__sync_build_commits([(ele['build_tag'], k, v) for ele in modified for k, v in ele.items()])
+
+    def __add_entries(self, comp, entries):
+        self.__check_columns((comp,))
+        if comp == 'build_url':
+            # build_no follows build_url
+            return self.__update_many([{'build_tag': tag, comp: data} for tag, data in entries])
+        if comp in Database.URL_COLUMNS:
+            entries = [(tag, Database.plain_url(data)) for tag, data in entries]
+        for schema in self.__schemas():
+            self.__cur.executemany(f"UPDATE {schema}.data_mgr SET {comp} = ? WHERE build_tag = ?", [(data, tag) for tag, data in entries])
+        self.__sync_build_commits([(tag, comp, data) for tag, data in entries])
+
+    def __insert_many(self, data_list):
+        # a re-inserted archived row comes back to the hot table
+        self.__delete_many([u.build_tag for u in data_list], self.__schemas()[1:])
+        self.__cur.executemany("insert into data_mgr values (:tag, :comp, :stype, :url, :rdate, :sdate, :cdate, :edate, :status, :blocker, :ispromo, :mainUrl, :report, :remarks, :commit, :gtick, :basecommit, :pdetail, :pstatus, :rscomponent, :cppatch, :relcommit, :buildno)",
+                               [self.__insert_params(u) for u in data_list])
+        self.__sync_build_commits([(u.build_tag, column, getattr(u, column)) for u in data_list for column in Database.MANIFEST_KINDS])
+
+    def __insert_params(self, u):
+        if not isinstance(u.release_sub_comp, str):
+            u.release_sub_comp=",".join(str(i) for i in u.release_sub_comp)
+        url = Database.plain_url(u.build_url)
+        return {'tag': u.build_tag, 'comp': u.comp_name, 'stype': u.stg_type, 'url': url, 'rdate': u.request_date, 'sdate': u.start_date, 'cdate': u.code_date,
+                'edate': u.end_date, 'status': u.status, 'blocker': u.blocker_tick, 'ispromo': u.is_promoted, 'mainUrl': Database.plain_url(u.promoted_main_build), 'report': Database.plain_url(u.details_report),
+                'remarks': u.remarks, 'commit': u.commit_info, 'gtick': u.ticket_fixed, 'basecommit': u.base_commit, 'pdetail': u.promo_details, 'pstatus': u.promo_status,
+                'rscomponent': u.release_sub_comp, 'cppatch': u.cp_patches, 'relcommit': u.release_commit, 'buildno': Database.build_no(url)}
+
+    def __check_columns(self, columns):
+        # column names end up in the statement text, so only accept real data_mgr columns
+        for column in columns:
+            if column not in Database.__TABLE_COLUMNS:
+                raise ValueError(f"Unknown data_mgr column: {column}")
+
+    def insert_data(self, u):
+        return self.insert_many([u])
+
+    @DBMetrics.timed
+    def insert_many(self, data_list):
+        """insert many Data rows in one transaction"""
+        try:
+            with self.transaction():
+                self.__insert_many(data_list)
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    @DBMetrics.timed
+    def delete_many(self, tags):
+        try:
+            with self.transaction():
+                self.__delete_many(tags)
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    @DBMetrics.timed
+    def update_many(self, modified):
+        """modified: list of dicts holding build_tag plus the columns to set"""
+        try:
+            with self.transaction():
+                self.__update_many(modified)
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    @DBMetrics.timed
+    def add_entries(self, comp, entries):
+        """set column comp for many (build_tag, value) pairs in one transaction"""
+        try:
+            with self.transaction():
+                self.__add_entries(comp, entries)
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    @DBMetrics.timed
+    def write_batch(self, batch):
+        """apply a WriteBatch in one transaction"""
+        try:
+            with self.transaction():
+                self.__insert_many(batch.inserted)
+                self.__delete_many(batch.deleted)
+                for comp, entries in batch.entries.items():
+                    self.__add_entries(comp, entries)
+            return "success"
+        except Exception as e:
+            return f"failed error:{e}"
+
+    def __run(self, sql, params):
+        # one read statement, slow ones land in the DBMetrics slow-query log with their plan
+        start = time.perf_counter()
+        if not self.execute(sql, params):
+            return None
+        rows = self.__cur.fetchall()
+        DBMetrics.record_statement(sql, params, time.perf_counter() - start, len(rows),
+                                   lambda: self.__connection.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall())
+        return rows
+
+    @DBMetrics.timed
+    def select(self, query):
+        """run a QueryBuilder query, returns (status, rows)"""
+        sql, params = query.build()
+        res, rows = self.__cached(('select', sql, tuple(params)), lambda: self.__select(query))
+        # callers may modify the list they get, the cached one stays as read
+        return (res, list(rows))
+
+    def __select(self, query):
+        try:
+            rows = self.__run(*query.build())
+            # the archive only holds rows up to its horizon, skip it when the hot rows already answer the query
+            if rows is not None and self.__needs_archive(query, rows):
+                rows = self.__run(*query.build(archive=True))
+            if rows is None:
                 return ("failed",())
+            return ("success", rows)
         except Exception as e:
             return (f"failed error:{e}",())
 
-    def get_data_by_filters(self,filters):
-        try:
-            with self.__connection:
-                query="select comp_name, stg_type, start_date, build_url, request_date, code_date, end_date, status, blocker_tick, is_promoted, promoted_main_build, details_report, remarks, commit_info, ticket_fixed, base_commit, promo_details, promo_status, release_sub_comp, cp_patches, release_commit, build_tag FROM data_mgr"
-                query+=f" where (comp_name = '{filters['comp_name']}')"
-                values=[]
-                for k,v in filters.items():
-                    if k in ["stg_type","status","is_promoted"]:
-                        query+=f" and ({k} in ({','.join('?'*len(v))}))"
-                        values.extend(v)
-                    elif k in ["build_url","ticket_fixed","promoted_main_build","details_report","cp_patches","remarks"]:
-                        query+=f" and ({k} like '%{v}%')"
-                    elif k in ["start_date","end_date"]:
-                        query+=f" and ('{v[0]}' <= {k}) and ({k} <= '{v[1]}')"
-                query+=" order by start_date desc;"
-                if(self.execute(query,values)):
-                    return ("success",self.__cur.fetchall())
-                return ("failed",())
+    def __needs_archive(self, query, rows):
+        horizon = self.archive_horizon()
+        archived = None
+        if horizon is not None and query.partition is not None:
+            # the partition column is one of QueryBuilder.COLUMNS, checked by top_per()
+            self.__cur.execute(f"select distinct {query.partition} from archive.data_mgr")
+            archived = {row[0] for row in self.__cur.fetchall()}
+        return query.needs_archive(horizon, rows, archived)
+
+    def iter_rows(self, query, chunk_size=1000):
+        """stream the rows of a QueryBuilder query in lists of up to chunk_size rows, one statement and no result cache,
+        so exports of the whole history run in constant memory"""
+        # without the hot result at hand, the archive is read whenever it can hold matching rows
+        sql, params = query.build(archive=self.__needs_archive(query, []))
+        cursor = self.__connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cursor.close()
+
+    def build_commits_for(self, build_tags):
+        """(build_tag, kind) + BUILD_COMMIT_COLUMNS rows of the manifests of build_tags, uncached, returns (status, rows)"""
+        try:
+            self.__cur.execute("select build_tag, kind, project, path, branch, commit_id, remote, staging_request, promoted "
+                               f"from {self.__build_commits()} where build_tag in ({', '.join('?' * len(build_tags))}) "
+                               "order by build_tag, kind, seq", tuple(build_tags))
+            return ("success", self.__cur.fetchall())
+        except Exception as e:
+            return (f"failed error:{e}", [])
+
+    @staticmethod
+    def to_frame(rows, columns, headers=None, index_start=None, dates=()):
+        """DataFrame over result rows in one pass, dates are converted per column and 'Index' numbered from index_start+1"""
+        df = pd.DataFrame.from_records(rows, columns=list(columns))
+        for column in dates:
+            df[column] = pd.to_datetime(df[column])
+        if headers is not None:
+            df.columns = list(headers)
+        if index_start is not None:
+            df.insert(0, 'Index', range(index_start + 1, index_start + 1 + len(df)))
+        return df
+
+    @DBMetrics.timed
+    def select_df(self, query, headers=None, index_start=None, dates=()):
+        """run a QueryBuilder query straight from the cursor into a DataFrame (see to_frame), no result cache,
+        returns (status, df)"""
+        # like iter_rows, the archive is read whenever it can hold matching rows
+        sql, params = query.build(archive=self.__needs_archive(query, []))
+        cursor = self.__connection.cursor()
+        try:
+            cursor.execute(sql, params)
+            return ("success", self.to_frame(cursor, query.columns, headers, index_start, dates))
+        except Exception as e:
+            return (f"failed error:{e}", None)
+        finally:
+            cursor.close()
+
+    @DBMetrics.timed
+    def top_per_component(self, entries=10, query=None):
+        """the latest entries rows of every component matching query, in one row_number() statement, returns (status, rows)"""
+        query = (query or QueryBuilder()).copy().top_per('comp_name', entries)
+        return self.select(query)
+
+    @DBMetrics.timed
+    def latest_promoted_per_component(self, entries=10, query=None):
+        """the latest entries promoted rows of every component, returns (status, rows)"""
+        return self.select(Database.latest_promoted_query(entries, query))
+
+    @staticmethod
+    def latest_promoted_query(entries=10, query=None):
+        """QueryBuilder of latest_promoted_per_component, e.g. to export the same rows"""
+        return (query or QueryBuilder()).copy().where_eq('is_promoted', 'Yes').top_per('comp_name', entries)
+
+    def filters_query(self, filters, omit=()):
+        """QueryBuilder for the Component Staging filters, see get_data_by_filters"""
+        return QueryBuilder.from_filters(filters, full_text=self.fts_enabled()).omit(*omit)
+
+    def get_data_by_filters(self, filters, omit=()):
+        try:
+            query = self.filters_query(filters, omit)
         except Exception as e:
             return (f"Failed DB error:{e}",())
+        return self.select(query)
+
+    def pages(self, query, page_size=50):
+        """KeysetPager over query, for date ranges too wide to fetch in one go"""
+        return KeysetPager(self, query, page_size)
 
     def remove_data_by_component(self, tag):
-        with self.__connection:
-            self.execute("DELETE from data_mgr WHERE build_tag = :tag", {'tag': tag})
+        self.delete_many([tag])
 
     def add_entry(self, tag, comp, data):
-        res = 1
-        cmd = f"UPDATE data_mgr SET {comp} = :data WHERE build_tag = :tag"
-        with self.__connection:
-            res = res * self.execute(cmd, {'tag': tag, 'data': data})
-        if res:
-            return "success"
-        return "failed"
+        return self.add_entries(comp, [(tag, data)])
 
+    @DBMetrics.timed
     def db_size(self):
-        self.execute("select count(*) from data_mgr")
-        return self.__cur.fetchone()[0]
+        return self.__cached(('db_size',), self.__db_size)
+
+    def __db_size(self):
+        size = 0
+        for schema in self.__schemas():
+            self.execute(f"select count(*) from {schema}.data_mgr")
+            size += self.__cur.fetchone()[0]
+        return size
 
+    @DBMetrics.timed
     def fetch_column_data(self, element):
-        self.execute(f"select {element} from data_mgr")
-        val = self.__cur.fetchall()
+        _, val = self.select(QueryBuilder().select(element))
         return [i[0] for i in val]
 
+
+atexit.register(Database.close_all)
@@ -0,0 +1,172 @@
+# Description : Latency/row-count statistics, slow-query log and query plan capture for Database calls.
+
+import atexit
+import bisect
+import collections
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+
+
+class DBMetrics(object):
+    """Process-wide statistics of the instrumented Database methods, shared by every thread"""
+
+    # histogram bucket upper bounds in ms, the last bucket is open ended
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+    # statements at least this slow go to the slow-query log together with their plan
+    SLOW_MS = float(os.environ.get('CQE_DB_SLOW_MS', 200))
+    SLOW_LOG_SIZE = 100
+    # opt-in JSON lines dump, slow statements are appended as they happen and the method summary on exit
+    DUMP_FILE = os.environ.get('CQE_DB_METRICS_FILE')
+
+    __lock = threading.Lock()
+    # method name -> {'calls', 'errors', 'rows', 'total_ms', 'max_ms', 'hist', 'last_error'}
+    __stats = {}
+    __slow = collections.deque(maxlen=SLOW_LOG_SIZE)
+    # per-thread call depth and totals, so a page render or script section can report its own database time
+    __local = threading.local()
+
+    @classmethod
+    def timed(cls, func):
+        """decorator recording latency, row count and failure status of a Database method"""
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            depth = getattr(cls.__local, 'depth', 0)
+            cls.__local.depth = depth + 1
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                cls.record(name, time.perf_counter() - start, error=str(e), outermost=depth == 0)
+                raise
+            finally:
+                cls.__local.depth = depth
+            rows, error = cls.__inspect(result)
+            cls.record(name, time.perf_counter() - start, rows, error, outermost=depth == 0)
+            return result
+        return wrapper
+
+    @staticmethod
+    def __inspect(result):
+        # Database methods return "success"/"failed..." or (status, rows)
+        status, payload = (result[0], result[1]) if isinstance(result, tuple) and len(result) == 2 else (result, None)
+        error = status if isinstance(status, str) and status.lower().startswith('failed') else None
+        rows = len(payload) if isinstance(payload, list) or hasattr(payload, 'shape') else None
+        return rows, error
+
+    @classmethod
+    def record(cls, name, elapsed, rows=None, error=None, outermost=True):
+        elapsed_ms = elapsed * 1000
+        with cls.__lock:
+            stats = cls.__stats.setdefault(name, {'calls': 0, 'errors': 0, 'rows': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                                  'hist': [0] * (len(cls.BUCKETS_MS) + 1), 'last_error': None})
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['hist'][bisect.bisect_left(cls.BUCKETS_MS, elapsed_ms)] += 1
+            if rows is not None:
+                stats['rows'] += rows
+            if error is not None:
+                stats['errors'] += 1
+                stats['last_error'] = error
+        if outermost:
+            # nested calls (latest_promoted_per_component -> select) are already inside their caller's time
+            cls.__local.calls = getattr(cls.__local, 'calls', 0) + 1
+            cls.__local.total_ms = getattr(cls.__local, 'total_ms', 0.0) + elapsed_ms
+
+    @classmethod
+    def record_statement(cls, sql, params, elapsed, rows, explain):
+        """log a statement slower than SLOW_MS, explain() returns its EXPLAIN QUERY PLAN rows and only runs for those"""
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms < cls.SLOW_MS:
+            return
+        try:
+            plan = [row[-1] for row in explain()]
+        except Exception as e:
+            plan = [f"plan unavailable: {e}"]
+        entry = {'type': 'slow', 'time': datetime.datetime.now().isoformat(timespec='seconds'), 'ms': round(elapsed_ms, 2),
+                 'rows': rows, 'sql': sql, 'params': [p if isinstance(p, (int, float, str)) or p is None else str(p) for p in params],
+                 'plan': plan}
+        with cls.__lock:
+            cls.__slow.append(entry)
+            if cls.DUMP_FILE:
+                with open(cls.DUMP_FILE, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+
+    @classmethod
+    def reset_thread(cls):
+        """start a new per-thread total, e.g. at the top of a page render"""
+        cls.__local.calls = 0
+        cls.__local.total_ms = 0.0
+
+    @classmethod
+    def thread_totals(cls):
+        """(calls, total_ms) of this thread since the last reset_thread()"""
+        return getattr(cls.__local, 'calls', 0), getattr(cls.__local, 'total_ms', 0.0)
+
+    @classmethod
+    def report(cls):
+        """one dict per method, the most expensive in total first"""
+        with cls.__lock:
+            items = [(name, dict(stats, hist=list(stats['hist']))) for name, stats in cls.__stats.items()]
+        report = []
+        for name, stats in items:
+            report.append({'method': name, 'calls': stats['calls'], 'errors': stats['errors'], 'rows': stats['rows'],
+                           'total_ms': round(stats['total_ms'], 2), 'mean_ms': round(stats['total_ms'] / stats['calls'], 2),
+                           'p50_ms': cls.__percentile(stats, 0.5), 'p95_ms': cls.__percentile(stats, 0.95),
+                           'max_ms': round(stats['max_ms'], 2), 'last_error': stats['last_error']})
+        return sorted(report, key=lambda r: r['total_ms'], reverse=True)
+
+    @classmethod
+    def __percentile(cls, stats, q):
+        # upper bound of the bucket holding the q-th call, the open last bucket reports the max seen
+        target = q * stats['calls']
+        seen = 0
+        for i, count in enumerate(stats['hist']):
+            seen += count
+            if count and seen >= target:
+                return min(cls.BUCKETS_MS[i], round(stats['max_ms'], 2)) if i < len(cls.BUCKETS_MS) else round(stats['max_ms'], 2)
+        return round(stats['max_ms'], 2)
+
+    @classmethod
+    def slow_queries(cls):
+        with cls.__lock:
+            return list(cls.__slow)
+
+    @classmethod
+    def format_report(cls):
+        """report() as a plain text table for the scripts' output"""
+        columns = ('method', 'calls', 'errors', 'rows', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms')
+        lines = [[str(r[c]) for c in columns] for r in cls.report()]
+        widths = [max([len(c)] + [len(line[i]) for line in lines]) for i, c in enumerate(columns)]
+        out = ['  '.join(c.ljust(w) for c, w in zip(columns, widths))]
+        out += ['  '.join(v.ljust(w) for v, w in zip(line, widths)) for line in lines]
+        out += [f"slow ({entry['ms']} ms, {entry['rows']} rows): {entry['sql']} {entry['params']} -> {'; '.join(entry['plan'])}"
+                for entry in cls.slow_queries()]
+        return '\n'.join(out)
+
+    @classmethod
+    def print_report(cls):
+        """print format_report() at the end of a script, where the database time went
+        (set CQE_DB_METRICS_FILE to also get it as JSON lines)"""
+        print(cls.format_report())
+
+    @classmethod
+    def dump(cls, path=None):
+        """append the method summary as JSON lines to path (default DUMP_FILE), returns the path written or None"""
+        path = path or cls.DUMP_FILE
+        if not path:
+            return None
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+        with open(path, 'a') as f:
+            for row in cls.report():
+                f.write(json.dumps(dict(row, type='method', time=now, pid=os.getpid())) + '\n')
+        return path
+
+
+atexit.register(DBMetrics.dump)
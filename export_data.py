@@ -0,0 +1,132 @@
+# Description : Script to stream filtered staging data into a CSV or Parquet file in constant memory
+
+import argparse
+import csv
+import datetime
+import os
+from database import Database
+from db_metrics import DBMetrics
+from query_builder import QueryBuilder
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    # only the parquet export needs pyarrow
+    pyarrow = None
+
+
+class ExportData:
+
+    FORMATS = ('csv', 'parquet')
+    # rows read and written per step, memory stays bounded by this whatever the size of the export
+    CHUNK_SIZE = 1000
+    # columns of the exploded manifest file, one row per (build, manifest kind, project)
+    COMMIT_COLUMNS = ('build_tag', 'kind') + Database.BUILD_COMMIT_COLUMNS
+
+    def __init__(self, db=None):
+        self.db = db or Database()
+
+    @staticmethod
+    def commits_path(path):
+        """where export() writes the exploded manifest rows next to path"""
+        stem, ext = os.path.splitext(path)
+        return f'{stem}_commits{ext}'
+
+    @staticmethod
+    def open_writer(path, fmt, header):
+        """(write(rows), close()) appending row chunks to a new csv or parquet file with the given header"""
+        if fmt == 'csv':
+            f = open(path, 'w', newline='')
+            writer = csv.writer(f)
+            writer.writerow(header)
+            return writer.writerows, f.close
+        if fmt != 'parquet':
+            raise NameError(f"Unknown export format: {fmt}")
+        if pyarrow is None:
+            raise NameError("Parquet export needs pyarrow, install it or export as csv")
+        # values are stored as text, as in the DB
+        schema = pyarrow.schema([(name, pyarrow.string()) for name in header])
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+        def write(rows):
+            columns = list(zip(*rows))
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array([None if v is None else str(v) for v in column], pyarrow.string()) for column in columns], schema=schema))
+        return write, writer.close
+
+    def export(self, query, path, fmt='csv', explode=False, progress=None, keep=None, max_rows=None):
+        """write every row of a QueryBuilder query to path chunk by chunk, with explode the manifest columns are written
+        to commits_path(path) as one row per project instead, progress(rows) is called after each chunk, keep({column: value})
+        drops the rows it is false for (filters a page applies after its query), max_rows stops the export after that many
+        rows, returns the number of rows written"""
+        columns = [c for c in QueryBuilder.VIEW_COLUMNS if not (explode and c in Database.MANIFEST_KINDS)]
+        query = query.copy().select(*columns).omit()
+        urls = [i for i, c in enumerate(columns) if c in Database.URL_COLUMNS]
+        tag = columns.index('build_tag')
+        write, close = self.open_writer(path, fmt, columns)
+        write_commits, close_commits = self.open_writer(self.commits_path(path), fmt, self.COMMIT_COLUMNS) if explode else (None, None)
+        written = 0
+        try:
+            for rows in self.db.iter_rows(query, self.CHUNK_SIZE):
+                rows = [list(row) for row in rows if keep is None or keep(dict(zip(columns, row)))]
+                if max_rows is not None:
+                    rows = rows[:max_rows - written]
+                if not rows:
+                    continue
+                # stored urls are plain, anchors written by older versions are unwrapped here
+                for row in rows:
+                    for i in urls:
+                        row[i] = Database.plain_url(row[i])
+                write(rows)
+                if explode:
+                    res, commits = self.db.build_commits_for([row[tag] for row in rows])
+                    if res != "success":
+                        raise NameError(f"DB failed to retrieve manifests: {res}")
+                    if commits:
+                        write_commits(commits)
+                written += len(rows)
+                if progress is not None:
+                    progress(written)
+                if max_rows is not None and written >= max_rows:
+                    break
+        finally:
+            close()
+            if explode:
+                close_commits()
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export staging data to CSV or Parquet")
+    parser._action_groups.pop()
+    required = parser.add_argument_group('Required arguments')
+    optional = parser.add_argument_group('Optional arguments')
+    required.add_argument("--out", required=True, help="File to write, exploded manifests go next to it as <name>_commits.<ext>")
+    optional.add_argument("--format", choices=ExportData.FORMATS, default='csv', help="Export format")
+    optional.add_argument("--component", default='all', help="Component name or 'all'")
+    optional.add_argument("--from-date", type=datetime.date.fromisoformat, help="Cycles started on or after this date (YYYY-MM-DD)")
+    optional.add_argument("--to-date", type=datetime.date.fromisoformat, help="Cycles started on or before this date (YYYY-MM-DD)")
+    optional.add_argument("--status", nargs='+', help="Staging verdicts to keep")
+    optional.add_argument("--promoted", choices=('Yes', 'No'), help="Only promoted or only not promoted cycles")
+    optional.add_argument("--search", nargs=2, action='append', metavar=('COLUMN', 'TEXT'), default=[],
+                          help=f"Substring filter on one of {', '.join(QueryBuilder.SEARCH_COLUMNS)}, as on Component Staging, may be repeated")
+    optional.add_argument("--explode-manifests", action='store_true', help="Write manifests as one row per project instead of columns")
+    args = parser.parse_args()
+    ed = ExportData()
+    ed.db.create_table()
+    # the Component Staging filter set, without comp_name for all components
+    filters = {} if args.component == 'all' else {'comp_name': args.component}
+    if args.from_date or args.to_date:
+        filters['start_date'] = [args.from_date, args.to_date]
+    if args.status:
+        filters['status'] = args.status
+    if args.promoted:
+        filters['is_promoted'] = [args.promoted]
+    for column, text in args.search:
+        if column not in QueryBuilder.SEARCH_COLUMNS:
+            parser.error(f"--search column must be one of {', '.join(QueryBuilder.SEARCH_COLUMNS)}, not {column}")
+        filters[column] = text
+    written = ed.export(ed.db.filters_query(filters), args.out, args.format, args.explode_manifests,
+                        lambda rows: print(f'{rows} rows written', end='\r'))
+    print(f'\nExported {written} rows to {args.out}' + (f' and manifests to {ExportData.commits_path(args.out)}' if args.explode_manifests else ''))
+    DBMetrics.print_report()
@@ -0,0 +1,100 @@
+# Description : Background worker threads running the jobs queued in the DB jobs table, one handler per job kind.
+
+import hashlib
+import threading
+import traceback
+from database import Database
+
+
+class JobQueue(object):
+    """Process-wide queue over the jobs table, a job is (kind, job_key) and is only run again when its input hash changes"""
+
+    # ticket extractions hold their repo checkout's lock, one worker per checkout plus one for the other jobs,
+    # claim_job() skips jobs whose lock_key another worker holds so no worker waits on a lock
+    WORKERS = 3
+    # idle workers look for jobs queued by other processes this often
+    POLL_SECONDS = 30
+    # failed jobs are queued again by retry_failed() until they were tried this often
+    MAX_ATTEMPTS = 3
+
+    __lock = threading.Lock()
+    # kind -> handler(db, job_key) returning "success" or "failed..."
+    __handlers = {}
+    __workers = []
+    __wake = threading.Event()
+    # lock keys of the jobs this process' workers are running
+    __busy = set()
+
+    @classmethod
+    def register(cls, kind, handler):
+        with cls.__lock:
+            cls.__handlers[kind] = handler
+
+    @classmethod
+    def start(cls, workers=None):
+        """start the worker threads once per process, jobs left running by a previous process are queued again"""
+        with cls.__lock:
+            if cls.__workers:
+                return
+            Database().recover_jobs()
+            for i in range(workers or cls.WORKERS):
+                worker = threading.Thread(target=cls.__work, name=f'job-worker-{i}', daemon=True)
+                cls.__workers.append(worker)
+                worker.start()
+
+    @staticmethod
+    def input_hash(*values):
+        """digest of the values a job result depends on"""
+        return hashlib.sha1(repr(values).encode()).hexdigest()
+
+    @classmethod
+    def submit(cls, db, kind, jobs):
+        """queue [(job_key, input_hash)] or [(job_key, input_hash, lock_key)] of kind and wake the workers, jobs sharing a
+        lock_key run one at a time, returns (status, number of jobs queued)"""
+        res, queued = db.enqueue_jobs(kind, [tuple(job) + (None,) * (3 - len(job)) for job in jobs])
+        if queued:
+            cls.__wake.set()
+        return res, queued
+
+    @classmethod
+    def status(cls, db, kind):
+        """({status: count}, [(job_key, error)] of the failed jobs) of kind"""
+        _, rows = db.get_jobs(kind)
+        counts = {}
+        for row in rows:
+            counts[row[1]] = counts.get(row[1], 0) + 1
+        return counts, [(row[0], row[3]) for row in rows if row[1] == 'failed']
+
+    @classmethod
+    def retry_failed(cls, db, kind):
+        """queue the failed jobs of kind again unless they failed MAX_ATTEMPTS times, returns (status, number queued)"""
+        res, queued = db.retry_jobs(kind, cls.MAX_ATTEMPTS)
+        if queued:
+            cls.__wake.set()
+        return res, queued
+
+    @classmethod
+    def __work(cls):
+        db = Database()
+        while True:
+            # claimed under the lock, so two workers never take jobs of the same lock key
+            with cls.__lock:
+                kinds = tuple(cls.__handlers)
+                res, job = db.claim_job(kinds, tuple(cls.__busy)) if kinds else ("success", None)
+                if res == "success" and job is not None and job[3] is not None:
+                    cls.__busy.add(job[3])
+            if res != "success" or job is None:
+                cls.__wake.wait(cls.POLL_SECONDS)
+                cls.__wake.clear()
+                continue
+            kind, job_key, input_hash, lock_key = job
+            try:
+                res = cls.__handlers[kind](db, job_key)
+            except Exception as e:
+                res = f"failed error:{e}\n{traceback.format_exc()}"
+            finally:
+                with cls.__lock:
+                    cls.__busy.discard(lock_key)
+            db.finish_job(kind, job_key, input_hash, None if res == "success" else str(res))
+            # jobs skipped for this lock key can run now
+            cls.__wake.set()
@@ -1,12 +1,17 @@
 # Author      : Lenine Ajagappane <Lenine.Ajagappane@amd.com>
 # Description : Utils to perform job/build related operation.
 
+import contextlib
+import fcntl
 import os
 import re
 import requests
 import subprocess
+import threading
 import xmltodict
+from job_queue import JobQueue
 from manifest_utils import ManifestUtils
+from query_builder import QueryBuilder
 
 
 class JobUtils:
@@ -49,6 +54,14 @@ class JobUtils:
         'ROCr'
     ]
 
+    # JobQueue kind refreshing the promoted details/status of promoted Mathlibs builds
+    PROMOTION_JOB = 'mathlibs_promotion'
+    # JobQueue kind filling ticket_fixed of a staging build from the git log, see refresh_ticket_fixed
+    TICKET_JOB = 'ticket_fixed'
+    # repo path -> lock, a repo sync and the branch checkouts of one ticket extraction must not interleave with another
+    __repo_locks = {}
+    __repo_locks_guard = threading.Lock()
+
     def __init__(self):
         self.manifest = ManifestUtils()
 
@@ -80,70 +93,101 @@ class JobUtils:
         finally:
             return cp_patches
 
-    def get_promoted_build_commits(self, data, comp_name):
-        promo_commit = ''
-        if data[10] != '<a href=""></a>':
-            promo_build = re.findall(r'href=[\'"]?([^\'" >]+)', data[10])[0]
+    def get_promoted_build_url(self, data, comp_name):
+        """promoted build url whose manifest holds the promoted commits, '' when there is none to fetch"""
+        if data[10] != '':
+            promo_build = data[10]
             promo_build = promo_build if promo_build.endswith('/') else promo_build + '/'
             if self.is_url(promo_build):
                 if comp_name in self.comp_manifest_map.keys():
-                    promo_commit = self.get_commit_from_build(promo_build, comp_name)
-        return promo_commit
+                    return promo_build
+        return ''
 
-    def get_commit_diff_for_release_stg(self, stg_commit_str, base_commit_str):
-        # [ProjectName, ProjectPath', BranchName, CommitId, RemoteName]
-        diff = []
-        diff_str = ''
-        stg_commit = self.format_manifest_data(stg_commit_str)        # [ProjectName, ProjectPath', BranchName, CommitId, RemoteName]
-        base_commit = self.format_manifest_data(base_commit_str)      # [ProjectName, ProjectPath', BranchName, CommitId, RemoteName]
-        for stg in stg_commit:
-            for base in base_commit:
-                if stg[0] == base[0]:
-                    if stg[3] == base[3]:
-                        break
-                    diff.append(f"name,{stg[0]},{stg[1]},{stg[2]},{stg[3]},{stg[4]}")
-                    break
-        diff_str = ','.join(diff)
-        return diff_str
+    def get_promoted_build_commits(self, data, comp_name):
+        promo_build = self.get_promoted_build_url(data, comp_name)
+        return self.get_commit_from_build(promo_build, comp_name) if promo_build else ''
+
+    def promotion_input_hash(self, data):
+        # the promoted build url, staging and base commits decide promo_details/promo_status
+        return JobQueue.input_hash(data[10], data[13], data[15])
+
+    def refresh_promotion(self, db, build_tag):
+        """PROMOTION_JOB handler, fetch the promoted build commits of a promoted build and recompute its promoted status"""
+        res, out_data = db.select(QueryBuilder.by_elements({'build_tag': build_tag}))
+        if res != "success":
+            return res
+        for out in out_data:
+            data = list(out)
+            promo_build = self.get_promoted_build_url(out, out[0])
+            data[16] = self.get_commit_from_build(promo_build, out[0]) if promo_build else ''
+            # a fetch that came back empty fails the job so it runs again, a done job waits for its input to change
+            if promo_build and not data[16]:
+                return f"failed error:no promoted build commits fetched from {promo_build}"
+            # the promoted status reads the promoted manifest just stored, a failure rolls both back
+            with db.transaction():
+                res = db.add_entry(build_tag, 'promo_details', data[16])
+                if res != "success":
+                    raise NameError(res)
+                res = db.add_entry(build_tag, 'promo_status', self.get_promoted_status_info(db, build_tag, True))
+                if res != "success":
+                    raise NameError(res)
+        return "success"
+
+    def ticket_input_hash(self, data, last_promoted_build):
+        # staging type, staging commits and the last promoted build decide ticket_fixed
+        return JobQueue.input_hash(data[0], data[1], data[13], last_promoted_build)
 
-    def get_promoted_status_info(self, data, is_promo=False):
-        # ['Component', 'StagingCommit', 'StagingBranch', 'StagingRemoteName', 'StagingRequest?', 'Promoted?']
+    def ticket_lock_key(self, comp_name):
+        # TICKET_JOB jobs of one repo checkout are run one at a time, see repo_lock
+        return os.path.normpath(self.repo_path(comp_name))
+
+    def refresh_ticket_fixed(self, db, build_tag):
+        """TICKET_JOB handler, tickets fixed by a staging build since the last promoted build of its component"""
+        res, out_data = db.select(QueryBuilder.by_elements({'build_tag': build_tag}))
+        if res != "success":
+            return res
+        for out in out_data:
+            if out[0] not in list(self.gerrit_projects):
+                ticket_str = 'Not Supported'
+            elif 'Win' in out[0]:
+                ticket_str = 'Not Supported'
+            elif 'Regular Staging' not in out[1]:
+                ticket_str = 'NA'
+            else:
+                _, last_promoted = db.get_last_promoted(out[0])
+                ticket_str = self.get_ticket_info_from_gitlog(out, last_promoted[1] if last_promoted else '')
+            if ticket_str == '':
+                # a git log run failed, the job is retried the next time it is queued
+                return f"failed error:ticket extraction failed for {build_tag}"
+            res = db.add_entry(out[-1], 'ticket_fixed', ticket_str)
+            if res != "success":
+                return res
+        return "success"
+
+    def get_commit_diff_for_release_stg(self, db, build_tag):
+        # staging projects whose commit differs from the base build, from the parsed manifests in build_commits
+        res, diff_rows = db.compare_commits(build_tag, 'staging', 'base')
+        if res != "success":
+            raise NameError("DB failed to retrieve")
+        return ','.join(f"name,{r[0]},{r[1]},{r[2]},{r[3]},{r[4]}" for r in diff_rows if r[3] != r[5])
+
+    def get_promoted_status_info(self, db, build_tag, is_promo=False):
+        # ['Component', 'StagingCommit', 'StagingBranch', 'StagingRemoteName', 'StagingRequest?', 'Promoted?'] per staging
+        # project found in the base manifest (and the promoted one when is_promo), from the parsed manifests in build_commits
+        res, rows = db.compare_commits(build_tag, 'staging', 'base', *(('promoted',) if is_promo else ()))
+        if res != "success":
+            raise NameError("DB failed to retrieve")
         diff = []
-        diff_str = ''
-        stg_commit = self.format_manifest_data(data[13])       # [ProjectName, ProjectPath', BranchName, CommitId, RemoteName]
-        base_commit = self.format_manifest_data(data[15])      # [ProjectName, ProjectPath', BranchName, CommitId, RemoteName]
-        promoted_commit = None
-        if not is_promo:
-            for stg in stg_commit:
-                for base in base_commit:
-                    promo_status = '-'
-                    stg_request = 'Yes'
-                    if stg[0] == base[0]:
-                        if stg[3] == base[3]:
-                            stg_request = 'No'
-                            promo_status = 'NA'
-                        diff.append(f"name,{stg[0]},{stg[3]},{stg[2]},{stg[4]},{stg_request},{promo_status}")
-                        break
-        else:
-            promoted_commit = self.format_manifest_data(data[16])  # [ProjectName, ProjectPath', BranchName, CommitId, RemoteName]
-            commit_status = self.format_manifest_data(data[17])  # ['Component', 'StagingCommit', 'StagingBranch', 'StagingRemoteName', 'StagingRequest?', 'Promoted?']
-            for stg in commit_status:
-                for base in base_commit:
-                    for promo in promoted_commit:
-                        promo_status = 'No'
-                        if stg[0] == base[0] == promo[0]:
-                            if stg[1] == base[3]:
-                                promo_status = 'NA'
-                            elif base[3] == promo[3]:
-                                promo_status = 'No'
-                            elif (stg[1] != base[3]) and (stg[1] != promo[3]):
-                                promo_status = 'No'
-                            elif (stg[1] != base[3]) and (stg[1] == promo[3]):
-                                promo_status = 'Yes'
-                            diff.append(f"name,{stg[0]},{stg[1]},{stg[2]},{stg[3]},{stg[4]},{promo_status}")
-                            break
-        diff_str = ','.join(diff)
-        return diff_str
+        for project, _, branch, commit, remote, base, *promo in rows:
+            stg_request = 'No' if commit == base else 'Yes'
+            if commit == base:
+                promo_status = 'NA'
+            elif not is_promo:
+                promo_status = '-'
+            else:
+                promo_status = 'Yes' if base != promo[0] and commit == promo[0] else 'No'
+            diff.append(f"name,{project},{commit},{branch},{remote},{stg_request},{promo_status}")
+        return ','.join(diff)
 
     def get_ticket_info_from_gitlog(self, data, last_promoted_build, promoted_build_commit=''):
         # Fetching last promoted staging build's commit details
@@ -153,25 +197,27 @@ class JobUtils:
             last_promo_commit = self.format_manifest_data(self.get_commit_from_build(last_promoted_build, data[0]))
         if data[13] != '' and data[13] != None and data[13] != 'None':
             stg_commit = self.format_manifest_data(data[13])
-            # Pull latest sources
-            repo_path = self.repo_sync(data[0])
-            tick_list = []
-            for stg in stg_commit:
-                for last in last_promo_commit:
-                    if stg[0] == last[0]:
-                        commit_dict = {}
-                        if stg[3] == last[3]: # if both staging & last promoted commit is same
-                            break
-                        elif ('Compiler' not in data[0] and stg[2] != last[2]): # if both staging & last promoted branch is different
-                            break
-                        else:
-                            commit_dict['project'] = stg[0]
-                            commit_dict['path'] = stg[1]
-                            commit_dict['stg_branch'] = stg[2]
-                            commit_dict['stg_commit'] = stg[3]
-                            commit_dict['promo_commit'] = last[3]
-                        ticlist = self.fetch_ticket_from_gitlog(repo_path, commit_dict)
-                        tick_list.extend(ticlist)
+            # the checkout is shared, one extraction per repo at a time
+            with self.repo_lock(data[0]):
+                # Pull latest sources
+                repo_path = self.repo_sync(data[0])
+                tick_list = []
+                for stg in stg_commit:
+                    for last in last_promo_commit:
+                        if stg[0] == last[0]:
+                            commit_dict = {}
+                            if stg[3] == last[3]: # if both staging & last promoted commit is same
+                                break
+                            elif ('Compiler' not in data[0] and stg[2] != last[2]): # if both staging & last promoted branch is different
+                                break
+                            else:
+                                commit_dict['project'] = stg[0]
+                                commit_dict['path'] = stg[1]
+                                commit_dict['stg_branch'] = stg[2]
+                                commit_dict['stg_commit'] = stg[3]
+                                commit_dict['promo_commit'] = last[3]
+                            ticlist = self.fetch_ticket_from_gitlog(repo_path, commit_dict)
+                            tick_list.extend(ticlist)
             tick_list = list(set(tick_list))
             print(f'Final No. of ticket in {data[-1]}: {len(tick_list)}')
             if not bool(tick_list):
@@ -182,22 +228,35 @@ class JobUtils:
         else:
             return 'NA'
 
+    def repo_path(self, comp_name):
+        repo_name = 'rocm_repo' if not 'Compiler' in comp_name else 'rocm_repo_compiler'
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), f'../{repo_name}')
+
+    @contextlib.contextmanager
+    def repo_lock(self, comp_name):
+        # exclusive use of the repo checkout of comp_name, against other threads and other processes (cron scripts)
+        repo_path = self.ticket_lock_key(comp_name)
+        with JobUtils.__repo_locks_guard:
+            lock = JobUtils.__repo_locks.setdefault(repo_path, threading.Lock())
+        with lock, open(f'{repo_path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield repo_path
+
     def repo_sync(self, comp_name):
         try:
             retry = 0
-            repo_name = 'rocm_repo' if not 'Compiler' in comp_name else 'rocm_repo_compiler'
-            repo_path = os.path.join(os.path.dirname(__file__), f'../{repo_name}')
+            repo_path = self.repo_path(comp_name)
             if not os.path.exists(repo_path):
                 os.makedirs(repo_path)
-            os.chdir(repo_path)
             init_cmd = 'repo init -u ssh://gerritgit/compute/ec/manifest.git -b lajagapp/cqe-staging -m cqe-dashboard-compute.xml --reference=/jenkins/reference-repo'
             sync_cmd = 'repo sync --force-sync'
-            p_status = self.run_bash_cmd(f'{init_cmd} && {sync_cmd}')
+            # commands run in the checkout, the process working directory is left alone
+            p_status = self.run_bash_cmd(f'{init_cmd} && {sync_cmd}', repo_path)
             if p_status != 0:
                 retry += 1
                 if retry > 5:
                     return
-                self.run_bash_cmd(f'sudo rm -rf * .* && {init_cmd} && repo forall --jobs=16 -c "git reset --hard" && {sync_cmd}')
+                self.run_bash_cmd(f'sudo rm -rf * .* && {init_cmd} && repo forall --jobs=16 -c "git reset --hard" && {sync_cmd}', repo_path)
         except Exception as e:
             print(e)
         finally:
@@ -212,19 +271,18 @@ class JobUtils:
             content = file.read()
             repo_data = xmltodict.parse(content)
             repo_manifest = self.manifest.extract_manifest_details(repo_data, [commit_dict['project']])
-            os.chdir(comp_path)
             checkout_cmd = f"git checkout {commit_dict['stg_branch']} && git pull"
             print(checkout_cmd)
-            p_status = self.run_bash_cmd(checkout_cmd)
+            p_status = self.run_bash_cmd(checkout_cmd, comp_path)
             if p_status != 0:
                 retry += 1
                 if retry > 5:
                     return
                 checkout_cmd2 = f"git pull origin {repo_manifest[4]} && git checkout {commit_dict['stg_branch']} && git pull"
-                self.run_bash_cmd(checkout_cmd2)
+                self.run_bash_cmd(checkout_cmd2, comp_path)
             cmd = f"git log {commit_dict['stg_commit']}...{commit_dict['promo_commit']} --grep SWDEV"
             print(cmd)
-            out = self.run_bash_cmd_return(cmd)
+            out = self.run_bash_cmd_return(cmd, comp_path)
             ticlist = re.findall(r"SWDEV-\d{6}", out)
             print(f"No. of ticket in {commit_dict['project']}: {len(ticlist)}")
             return ticlist
@@ -293,17 +351,17 @@ class JobUtils:
                 print(e)
                 continue
 
-    def run_bash_cmd(self, command):
+    def run_bash_cmd(self, command, cwd=None):
         bash_stdout = None
         bash_stderr = None
-        p = subprocess.Popen(command, stdout=bash_stdout, stderr=bash_stderr, shell=True)
+        p = subprocess.Popen(command, stdout=bash_stdout, stderr=bash_stderr, shell=True, cwd=cwd)
         (output, err) = p.communicate()
         p_status = p.wait()
         if bash_stdout is not None:
             output = output.decode('utf-8')
         return p_status
 
-    def run_bash_cmd_return(self, command):
-        p = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    def run_bash_cmd_return(self, command, cwd=None):
+        p = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, cwd=cwd)
         (output, err) = p.communicate()
         return output.strip()
@@ -0,0 +1,56 @@
+# Description : Rule table turning staging/promoted build URLs into their short dashboard labels, memoized per URL.
+
+import functools
+import re
+
+
+class LinkLabels(object):
+    """Ordered (pattern, label) rules per link type, the first matching pattern labels the URL"""
+
+    # {build} is the last path segment, {tail} the text after the last '-'
+    RULES = {
+        'staging': (
+            (re.compile(r'(?:^|-)rt(?:-|$)'), 'rt-win/{build}'),
+            (re.compile(r'rel.*component-staging'), 'release-staging/{build}'),
+            (re.compile(r'(?:^|-)cpl(?:-|$)'), 'cpl-win/{build}'),
+            (re.compile(r'(?:^|-)afar(?:-|$)'), 'afar-profiler/{build}'),
+            (re.compile(r'compute-psdb-no-npi'), 'compute-psdb/{build}'),
+            (re.compile(r'-[^-]+$'), '{tail}'),
+        ),
+        'promoted': (
+            (re.compile(r'(?:^|/)compute-rocm-dkms-no-npi-hipclang(?:/|$)'), 'mainline/{build}'),
+            (re.compile(r'(?:^|-)rel(?:-|$)'), 'release/{build}'),
+        ),
+    }
+    MEMO_SIZE = 8192
+
+    @staticmethod
+    @functools.lru_cache(maxsize=MEMO_SIZE)
+    def label(type, url):
+        """short label of a build url, the url itself (without trailing '/') when no rule matches"""
+        url = url[:-1] if url.endswith('/') else url
+        for pattern, label in LinkLabels.RULES.get(type, ()):
+            if pattern.search(url):
+                return label.format(build=url.split('/')[-1], tail=url.split('-')[-1])
+        return url
+
+    @staticmethod
+    def format_rows(styler, column, labels):
+        """styler with each cell of column displayed as the label at its row position in labels"""
+        data = styler.data
+        # row indexes per label per cell value, most values are unique or always carry the same label
+        rows = {}
+        for index, value, label in zip(data.index, data[column], labels):
+            rows.setdefault(value, {}).setdefault(label, []).append(index)
+        shared = {value: next(iter(by_label)) for value, by_label in rows.items() if len(by_label) == 1}
+        styler = styler.format(lambda x, shared=shared: shared.get(x, x), subset=[column])
+        # the same value labelled differently in other rows, e.g. a report url shared by two builds, is formatted per row
+        for by_label in rows.values():
+            if len(by_label) > 1:
+                for label, index in by_label.items():
+                    styler = styler.format(lambda x, label=label: label, subset=(index, [column]))
+        return styler
+
+    @staticmethod
+    def cache_info():
+        return LinkLabels.label.cache_info()
@@ -0,0 +1,268 @@
+# Description : Composable, fully parameterized SELECT builder for the data_mgr table.
+
+import copy
+import datetime
+import functools
+
+
+class QueryBuilder(object):
+
+    # default projection, in the positional order every caller indexes result rows by (see Data)
+    DATA_COLUMNS = ('comp_name', 'stg_type', 'start_date', 'build_url', 'request_date', 'code_date', 'end_date',
+                    'status', 'blocker_tick', 'is_promoted', 'promoted_main_build', 'details_report', 'remarks',
+                    'commit_info', 'ticket_fixed', 'base_commit', 'promo_details', 'promo_status', 'release_sub_comp',
+                    'cp_patches', 'release_commit', 'build_tag')
+    # DATA_COLUMNS plus the build_no derived from build_url, for the views rendering build numbers
+    VIEW_COLUMNS = DATA_COLUMNS + ('build_no',)
+    # column names end up in the statement text, so nothing outside this set is accepted
+    COLUMNS = frozenset(VIEW_COLUMNS)
+    # rows returned by the element lookups when no date range is given
+    DEFAULT_LIMIT = 10
+    # total order used for keyset pagination, (start_date, build_tag) is unique since build_tag is the key
+    KEYSET = ('start_date', 'build_tag')
+    # columns of the Component Staging substring filters, see from_filters()
+    SEARCH_COLUMNS = ('build_url', 'ticket_fixed', 'promoted_main_build', 'details_report', 'cp_patches', 'remarks')
+
+    def __init__(self, table='data_mgr'):
+        self.__table = table
+        self.__columns = self.DATA_COLUMNS
+        self.__omitted = frozenset()
+        # (kind, column, arity) per where clause, the values go to __params in the same order
+        self.__clauses = []
+        self.__params = []
+        self.__order = (('start_date', True),)
+        self.__limit = None
+        # (column, entries): keep only the first entries rows of every column value, see top_per()
+        self.__partition = None
+        # highest lower bound put on start_date, decides whether the archive can hold matching rows
+        self.__start_low = None
+
+    @classmethod
+    def by_elements(cls, data, from_date=-1, to_date=-1):
+        """equality on every data item, within [from_date, to_date] on start_date or else the latest DEFAULT_LIMIT rows"""
+        query = cls()
+        for column, value in data.items():
+            query.where_eq(column, value)
+        if from_date != -1:
+            query.where_range('start_date', from_date, to_date)
+        else:
+            query.limit(cls.DEFAULT_LIMIT)
+        return query
+
+    @classmethod
+    def from_filters(cls, filters, full_text=False):
+        """query for the Component Staging "Filter On" options, substring filters use data_mgr_fts if full_text,
+        without a comp_name every component matches"""
+        query = cls().where_eq('comp_name', filters['comp_name']) if 'comp_name' in filters else cls()
+        for k, v in filters.items():
+            if k in ["stg_type", "status", "is_promoted"]:
+                query.where_in(k, v)
+            elif k in cls.SEARCH_COLUMNS:
+                if full_text:
+                    query.where_search(k, v)
+                else:
+                    query.where_contains(k, v)
+            elif k in ["start_date", "end_date"]:
+                query.where_range(k, v[0], v[1])
+        return query
+
+    def select(self, *columns):
+        self.__check(columns)
+        self.__columns = tuple(columns)
+        return self
+
+    def omit(self, *columns):
+        """project omitted columns as '' so rows keep their positions without carrying the (large) values"""
+        self.__check(columns)
+        self.__omitted = frozenset(columns)
+        return self
+
+    def where_eq(self, column, value):
+        self.__check((column,))
+        if value == '':
+            # rendered as a literal: sqlite never matches a partial index WHERE clause against a bound parameter
+            self.__clauses.append(('empty', column, 0))
+        else:
+            self.__clauses.append(('eq', column, 1))
+            self.__params.append(self.__value(value))
+        return self
+
+    def where_in(self, column, values):
+        self.__check((column,))
+        values = [self.__value(v) for v in values]
+        self.__clauses.append(('in', column, len(values)))
+        self.__params.extend(values)
+        return self
+
+    def where_range(self, column, low=None, high=None):
+        """low <= column <= high, either bound may be None"""
+        self.__check((column,))
+        if low is not None:
+            self.__clauses.append(('ge', column, 1))
+            self.__params.append(self.__value(low))
+            if column == 'start_date':
+                self.__start_low = max(self.__start_low or '', str(self.__value(low)))
+        if high is not None:
+            self.__clauses.append(('le', column, 1))
+            self.__params.append(self.__value(high))
+        return self
+
+    def where_contains(self, column, value):
+        """case-insensitive substring match, same as the old like '%value%'"""
+        self.__check((column,))
+        self.__clauses.append(('like', column, 1))
+        self.__params.append(self.__value(value))
+        return self
+
+    def where_search(self, column, value):
+        """where_contains answered by the data_mgr_fts trigram index (see Database.create_fts)"""
+        self.__check((column,))
+        self.__clauses.append(('fts', column, 1))
+        self.__params.append(self.__value(value))
+        return self
+
+    def where_keyset(self, key, before=False):
+        """rows after key (or before it) in (start_date desc, build_tag desc) order, key is a (start_date, build_tag) pair"""
+        self.__clauses.append(('keyset_before' if before else 'keyset_after', self.KEYSET, 2))
+        self.__params.extend(self.__value(v) for v in key)
+        return self
+
+    def order_by(self, *order):
+        """order_by(('start_date', True), ('build_tag', False)), the flag means descending"""
+        self.__check(column for column, _ in order)
+        self.__order = tuple((column, bool(desc)) for column, desc in order)
+        return self
+
+    def limit(self, entries):
+        self.__limit = int(entries) if entries is not None else None
+        return self
+
+    def top_per(self, column, entries):
+        """only the first entries rows, in order_by order, of every column value (row_number() over (partition by column)),
+        e.g. top_per('comp_name', 10) is the latest 10 cycles of each component in one statement"""
+        self.__check((column,))
+        self.__partition = (column, int(entries))
+        return self
+
+    def copy(self):
+        query = copy.copy(self)
+        query.__clauses = list(self.__clauses)
+        query.__params = list(self.__params)
+        return query
+
+    @property
+    def columns(self):
+        return self.__columns
+
+    def shape(self):
+        """everything that decides the statement text, values excluded"""
+        return (self.__table, self.__columns, self.__omitted, tuple(self.__clauses), self.__order, self.__limit is not None,
+                self.__partition[0] if self.__partition else None)
+
+    @property
+    def partition(self):
+        """the top_per() column, None without one"""
+        return self.__partition[0] if self.__partition else None
+
+    def needs_archive(self, horizon, rows, archived=None):
+        """whether rows, the result of this query on the hot table, can miss archived rows (start_date <= horizon),
+        archived is the set of partition values the archive holds rows of, needed for a top_per() query"""
+        if horizon is None:
+            return False
+        if self.__start_low is not None and self.__start_low > horizon:
+            return False
+        newest_first = (self.__order[:1] == (('start_date', True),) and 'start_date' in self.__columns
+                        and 'start_date' not in self.__omitted)
+        if self.__partition is not None:
+            column, entries = self.__partition
+            if archived is None or not newest_first or self.__limit is not None or column not in self.__columns:
+                return True
+            # each archived partition needs a full top in the hot rows, ending newer than the archive,
+            # a partition missing from the hot rows is entirely archived
+            part, start = self.__columns.index(column), self.__columns.index('start_date')
+            counts, oldest = {}, {}
+            for row in rows:
+                counts[row[part]] = counts.get(row[part], 0) + 1
+                oldest[row[part]] = min(oldest.get(row[part], row[start]), row[start])
+            return any(counts.get(value, 0) < entries or oldest[value] <= horizon for value in archived)
+        # a full page ordered newest first whose last row is newer than the archive already holds the top rows
+        if self.__limit is not None and len(rows) >= self.__limit and newest_first:
+            return rows[-1][self.__columns.index('start_date')] <= horizon
+        return True
+
+    def build(self, archive=False):
+        """return (sql, params) ready for cursor.execute, with archive the query also covers archive.data_mgr"""
+        params = list(self.__params) * (2 if archive else 1)
+        if self.__partition is not None:
+            params.append(self.__partition[1])
+        if self.__limit is not None:
+            params.append(self.__limit)
+        return QueryBuilder.__render(self.shape(), archive), params
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def __render(shape, archive=False):
+        # the same shape always yields the same text, which keeps sqlite3's per-connection statement cache warm
+        table, columns, omitted, clauses, order, limited, partition = shape
+        projection = ", ".join(f"'' as {c}" if c in omitted else c for c in columns)
+        if archive or partition:
+            # the source rows carry the sort keys (and partition column), so the outer query can order or
+            # number them whatever the projection is
+            keys = "".join(f", {column} as _key_{i}" for i, (column, _) in enumerate(order))
+            keys += f", {partition} as _part" if partition else ""
+            schemas = ('main.', 'archive.') if archive else ('',)
+            source = " union all ".join(f"select {projection}{keys} FROM {schema}{table}{QueryBuilder.__where(clauses, schema != 'archive.')}"
+                                        for schema in schemas)
+            order = tuple((f"_key_{i}", desc) for i, (_, desc) in enumerate(order))
+            if partition:
+                window = " order by " + ", ".join(f"{column} desc" if desc else column for column, desc in order) if order else ""
+                source = f"select *, row_number() over (partition by _part{window}) as _rn FROM ({source})"
+                sql = f"select {', '.join(columns)} FROM ({source}) where _rn <= ?"
+            else:
+                sql = f"select {', '.join(columns)} FROM ({source})"
+        else:
+            sql = f"select {projection} FROM {table}{QueryBuilder.__where(clauses, True)}"
+        if order:
+            sql += " order by " + ", ".join(f"{column} desc" if desc else column for column, desc in order)
+        if limited:
+            sql += " limit ?"
+        return sql + ";"
+
+    @staticmethod
+    def __where(clauses, full_text):
+        # data_mgr_fts only indexes the hot table, the archive answers substring filters with like
+        terms = []
+        for kind, column, arity in clauses:
+            if kind == 'empty':
+                terms.append(f"({column} = '')")
+            elif kind == 'eq':
+                terms.append(f"({column} = ?)")
+            elif kind == 'in':
+                terms.append(f"({column} in ({','.join('?' * arity)}))")
+            elif kind == 'ge':
+                terms.append(f"(? <= {column})")
+            elif kind == 'le':
+                terms.append(f"({column} <= ?)")
+            elif kind == 'like':
+                terms.append(f"({column} like '%' || ? || '%')")
+            elif kind == 'keyset_after':
+                terms.append(f"(({', '.join(column)}) < (?, ?))")
+            elif kind == 'keyset_before':
+                terms.append(f"(({', '.join(column)}) > (?, ?))")
+            elif kind == 'fts' and full_text:
+                # trigram tokenizer serves like '%...%' from the index (case-insensitive, same as like)
+                terms.append(f"(rowid in (select rowid from data_mgr_fts where {column} like '%' || ? || '%'))")
+            elif kind == 'fts':
+                terms.append(f"({column} like '%' || ? || '%')")
+        return " where " + " and ".join(terms) if terms else ""
+
+    def __check(self, columns):
+        for column in columns:
+            if column not in self.COLUMNS:
+                raise ValueError(f"Unknown data_mgr column: {column}")
+
+    def __value(self, value):
+        # dates are stored as their str() form, bind them the same way instead of relying on sqlite3 adapters
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return str(value)
+        return value
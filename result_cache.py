@@ -0,0 +1,43 @@
+# Description : Bounded LRU of read results, each entry valid for the database version it was read at.
+
+import collections
+import threading
+
+
+class ResultCache(object):
+    """Thread-safe LRU mapping a read (method, sql, params) to its result at one database version"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.__lock = threading.Lock()
+        # key -> (version, value), oldest first
+        self.__entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """return (hit, value), an entry read at another version is dropped"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return False, None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key, version, value):
+        with self.__lock:
+            self.__entries[key] = (version, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self):
+        return len(self.__entries)
@@ -0,0 +1,21 @@
+import re
+import pandas as pd
+from link_labels import LinkLabels
+
+
+def rendered(styler):
+    """display text of the data cells, row by row"""
+    return re.findall(r'<td [^>]*class="data[^"]*"[^>]*>([^<]*)</td>', styler.to_html())
+
+
+def test_duplicate_urls_keep_their_row_label():
+    url = 'http://reports/shared'
+    df = pd.DataFrame({'Detailed Report URL': [url, url, 'NA', url]})
+    styler = LinkLabels.format_rows(df.style, 'Detailed Report URL', ['101_Report', '102_Report', '', '101_Report'])
+    assert rendered(styler) == ['101_Report', '102_Report', '', '101_Report']
+
+
+def test_unique_urls_get_their_label():
+    df = pd.DataFrame({'Staging Build URL': ['http://a/1', 'http://a/2']}, index=[5, 7])
+    styler = LinkLabels.format_rows(df.style, 'Staging Build URL', (label for label in ['1', '2']))
+    assert rendered(styler) == ['1', '2']
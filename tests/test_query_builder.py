@@ -0,0 +1,58 @@
+from query_builder import QueryBuilder
+
+HORIZON = '2024-06-30'
+
+
+def row(comp_name, start_date):
+    """a DATA_COLUMNS row with only the columns needs_archive reads filled in"""
+    values = dict.fromkeys(QueryBuilder.DATA_COLUMNS, '')
+    values.update(comp_name=comp_name, start_date=start_date)
+    return tuple(values[c] for c in QueryBuilder.DATA_COLUMNS)
+
+
+def test_no_archive_never_needs_it():
+    assert not QueryBuilder().needs_archive(None, [])
+
+
+def test_range_newer_than_archive_skips_it():
+    query = QueryBuilder().where_range('start_date', '2024-07-01', '2024-07-31')
+    assert not query.needs_archive(HORIZON, [])
+    query = QueryBuilder().where_range('start_date', '2024-06-01', '2024-07-31')
+    assert query.needs_archive(HORIZON, [row('a', '2024-07-02')])
+
+
+def test_full_page_newer_than_archive_skips_it():
+    query = QueryBuilder().limit(2)
+    assert not query.needs_archive(HORIZON, [row('a', '2024-07-02'), row('a', '2024-07-01')])
+    # a short page or one reaching the horizon may continue in the archive
+    assert query.needs_archive(HORIZON, [row('a', '2024-07-02')])
+    assert query.needs_archive(HORIZON, [row('a', '2024-07-02'), row('a', HORIZON)])
+
+
+def test_oldest_first_page_needs_archive():
+    query = QueryBuilder().order_by(('start_date', False)).limit(1)
+    assert query.needs_archive(HORIZON, [row('a', '2024-07-02')])
+
+
+def test_top_per_full_and_newer_skips_archive():
+    query = QueryBuilder().top_per('comp_name', 2)
+    rows = [row('a', '2024-07-02'), row('a', '2024-07-01'), row('b', '2024-07-03'), row('b', '2024-07-01')]
+    assert not query.needs_archive(HORIZON, rows, archived={'a', 'b'})
+    # components without archived rows may have short tops
+    assert not query.needs_archive(HORIZON, rows + [row('c', '2024-07-01')], archived={'a', 'b'})
+
+
+def test_top_per_short_or_old_partition_needs_archive():
+    query = QueryBuilder().top_per('comp_name', 2)
+    full = [row('a', '2024-07-02'), row('a', '2024-07-01')]
+    assert query.needs_archive(HORIZON, full + [row('b', '2024-07-03')], archived={'a', 'b'})
+    assert query.needs_archive(HORIZON, full + [row('b', '2024-07-03'), row('b', HORIZON)], archived={'a', 'b'})
+    # a component missing from the hot rows is entirely archived
+    assert query.needs_archive(HORIZON, full, archived={'a', 'b'})
+
+
+def test_top_per_without_archived_values_or_partition_column_needs_archive():
+    rows = [row('a', '2024-07-02'), row('a', '2024-07-01')]
+    assert QueryBuilder().top_per('comp_name', 2).needs_archive(HORIZON, rows)
+    query = QueryBuilder().select('start_date', 'build_tag').top_per('comp_name', 2)
+    assert query.needs_archive(HORIZON, [('2024-07-02', 'a_2'), ('2024-07-01', 'a_1')], archived={'a'})
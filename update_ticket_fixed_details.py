@@ -4,9 +4,11 @@
 import argparse
 import datetime
 import dateutil.relativedelta as rd
-import re
 from dashboard import Dashboard
 from database import Database
+from db_metrics import DBMetrics
+from query_builder import QueryBuilder
+from job_queue import JobQueue
 from job_utils import JobUtils
 
 
@@ -14,15 +16,15 @@ class UpdateTicketFixedDetails:
 
     def __init__(self):
         self.build = JobUtils()
-        self.dashboard = Dashboard()
         self.db = Database()
+        self.db.create_table()
 
     def update_ticket_fixed_if_empty(self, component):
         to_date = datetime.datetime.now()
         from_date = to_date + rd.relativedelta(months = -1)
         to_date = to_date.date()
         from_date = from_date.date()
-        component_list = self.dashboard.comp_names if component == 'all' else [component]
+        component_list = Dashboard.comp_names if component == 'all' else [component]
         for comp_name in component_list:
             try:
                 # Updating ticket_fixed column for all components if empty for last 30days
@@ -31,41 +33,44 @@ class UpdateTicketFixedDetails:
                     'comp_name': comp_name,
                     'ticket_fixed': ''
                 }
-                res, out_data = self.db.get_data_by_two_elements(option, from_date=from_date, to_date=to_date)
+                res, out_data = self.db.select(QueryBuilder.by_elements(option, from_date=from_date, to_date=to_date))
                 if res != "success":
                     raise NameError("DB failed to retrieve")
                 if bool(out_data):
-                    for out in out_data:
-                        print(f'build_tag: {out[-1]}')
-                        if comp_name not in list(self.build.gerrit_projects):
-                            ticket_str = 'Not Supported'
-                        elif 'Win' in out[0]:
-                            ticket_str = 'Not Supported'
-                        elif 'Regular Staging' not in out[1]:
-                            ticket_str = 'NA'
-                        else:
-                            last_promoted_build = self.dashboard.get_last_promoted_build(self.db, out[0])
-                            print(f'Last_promoted_build: {last_promoted_build}')
-                            last_promo_commit = ''
-                            if 'Compiler' in comp_name:
-                                build_no = re.search('.*/(\d+)/?$', last_promoted_build).group(1)
-                                build_tag = f"{comp_name.split('-')[0].lower()}_{build_no}"
-                                print(f'Last promoted build_tag: {build_tag}')
-                                res, out_data = self.db.get_data_by_element('build_tag', build_tag)
-                                if res != "success":
-                                    raise NameError("DB failed to retrieve")
-                                last_promo_commit = out_data[0][13]
-                                print(f'last_promo_commit: {last_promo_commit}')
-                            ticket_str = self.build.get_ticket_info_from_gitlog(out, last_promoted_build, last_promo_commit)
-                        if ticket_str != '':
-                            self.update_entry_in_db(out, ticket_str)
+                    with self.db.batch() as batch:
+                        for out in out_data:
+                            print(f'build_tag: {out[-1]}')
+                            if comp_name not in list(self.build.gerrit_projects):
+                                ticket_str = 'Not Supported'
+                            elif 'Win' in out[0]:
+                                ticket_str = 'Not Supported'
+                            elif 'Regular Staging' not in out[1]:
+                                ticket_str = 'NA'
+                            else:
+                                _, last_promoted = self.db.get_last_promoted(out[0])
+                                last_promoted_build, build_no = (last_promoted[1], last_promoted[2]) if last_promoted else ('', '')
+                                print(f'Last_promoted_build: {last_promoted_build}')
+                                last_promo_commit = ''
+                                if 'Compiler' in comp_name:
+                                    build_tag = f"{comp_name.split('-')[0].lower()}_{build_no}"
+                                    print(f'Last promoted build_tag: {build_tag}')
+                                    res, out_data = self.db.select(QueryBuilder.by_elements({'build_tag': build_tag}))
+                                    if res != "success":
+                                        raise NameError("DB failed to retrieve")
+                                    last_promo_commit = out_data[0][13]
+                                    print(f'last_promo_commit: {last_promo_commit}')
+                                ticket_str = self.build.get_ticket_info_from_gitlog(out, last_promoted_build, last_promo_commit)
+                            if ticket_str != '':
+                                self.update_entry_in_db(out, ticket_str, batch)
                 else:
                     print('No empty ticket_fixed entry in last 30 days.')
             except Exception as e:
                 print(e)
 
-    def update_entry_in_db(self, out, ticket_str):
-        res = self.db.add_entry(out[-1], 'ticket_fixed', ticket_str)
+    def update_entry_in_db(self, out, ticket_str, writer=None):
+        # writer is either the Database itself or a batch from Database.batch()
+        writer = self.db if writer is None else writer
+        res = writer.add_entry(out[-1], 'ticket_fixed', ticket_str)
         if res != "success":
             raise NameError("DB commit failed")
         print(f'Updated the ticket_fixed for {out[-1]} --> {ticket_str}')
@@ -79,3 +84,8 @@ if __name__ == "__main__":
     optional.add_argument("--component", default='all', help="Component name")
     args = parser.parse_args()
     utfd.update_ticket_fixed_if_empty(args.component)
+    # extractions the dashboard's workers failed are queued for them again
+    res, queued = JobQueue.retry_failed(utfd.db, JobUtils.TICKET_JOB)
+    print(f'Queued {queued} failed ticket_fixed jobs again.' if res == "success" else res)
+    DBMetrics.print_report()
+